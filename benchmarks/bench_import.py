@@ -0,0 +1,60 @@
+"""Import time benchmark.
+
+Measures the wall time of `import volpy` in fresh interpreters and fails when
+the median goes above a threshold (1 second by default), guarding against
+regressions in the lazy loading of the plotting, symbolic and meshing
+dependencies.
+
+Usage:
+    python benchmarks/bench_import.py [--runs 10] [--max-seconds 1.0]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def time_import(statement):
+    """Returns the seconds taken by statement in a fresh interpreter."""
+    code = ('import time\n'
+            'start = time.perf_counter()\n' +
+            statement + '\n' +
+            'print(time.perf_counter() - start)')
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = os.pathsep.join(
+        [ROOT, environment.get('PYTHONPATH', '')])
+    result = subprocess.run([sys.executable, '-c', code],
+                            env=environment,
+                            capture_output=True,
+                            text=True,
+                            check=True)
+    return float(result.stdout)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--max-seconds', type=float, default=1.0,
+                        help='fail when the median `import volpy` is slower')
+    arguments = parser.parse_args()
+
+    statements = {
+        'import volpy': 'import volpy',
+        'volpy.TriangularMesh': 'import volpy; volpy.TriangularMesh',
+        'volpy.terrain_plots': 'import volpy; volpy.terrain_plots',
+    }
+    medians = {}
+    for (name, statement) in statements.items():
+        times = [time_import(statement) for _ in range(arguments.runs)]
+        medians[name] = statistics.median(times)
+        print('{:<24} median {:.3f}s  min {:.3f}s'.format(
+            name, medians[name], min(times)))
+
+    if medians['import volpy'] > arguments.max_seconds:
+        print('import volpy is slower than {:.3f}s'.format(
+            arguments.max_seconds))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""Volume benchmark suite on synthetic terrains.
+
+For each terrain size, times and records the peak traced memory of:
+  - Survey loading for every source format and coordinate system
+  - TriangularMesh construction
+  - get_volume, get_cut_volume/get_fill_volume and get_volume_curves
+  - SurveyPlot figure building (up to --max-plot-points)
+On sizes up to --verify-points, results are checked against the sympy
+reference integrator on a sample of triangles, and the cut/fill results
+against each other.
+
+Usage:
+    python benchmarks/bench_volumes.py --sizes 1e3 1e4 1e5 [--output r.json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from terrain import generate_terrain, write_sources
+import volpy
+from volpy import CartesianCoordinate, CoordinateSystem, Survey, Triangle
+from volpy.geometry import get_prism_volumes
+
+
+class Recorder():
+    """Times stages and records their peak traced memory."""
+
+    def __init__(self, track_memory=True):
+        self.track_memory = track_memory
+        self.records = []
+        if track_memory:
+            tracemalloc.start()
+
+    def run(self, size, stage, function, *args, **kwargs):
+        """Runs function, records and prints its metrics. Returns its result."""
+        if self.track_memory:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        peak = None
+        if self.track_memory:
+            peak = (tracemalloc.get_traced_memory()[1] - baseline)/2**20
+        record = {'points': size,
+                  'stage': stage,
+                  'seconds': seconds,
+                  'peak_mb': peak}
+        self.records.append(record)
+        print('{:>10} {:<36} {:>10.3f}s {:>10}'.format(
+            size, stage, seconds,
+            '-' if peak is None else '{:.1f}MB'.format(peak)))
+        return result
+
+def verify(mesh, triangles, seed=0):
+    """
+    Checks the analytic engines against the sympy reference integrator on a
+    sample of triangles and the cut/fill results against each other. Raises
+    AssertionError on mismatch.
+    """
+    x = mesh.point_cloud['x'].to_numpy()
+    y = mesh.point_cloud['y'].to_numpy()
+    z = mesh.point_cloud['z'].to_numpy()
+    generator = np.random.default_rng(seed)
+    sample = generator.choice(len(mesh.data),
+                              size=min(triangles, len(mesh.data)),
+                              replace=False)
+    analytic = get_prism_volumes(x, y, z, mesh.data[sample])
+    for (index, expected) in zip(sample, analytic):
+        points = [CartesianCoordinate(x[i], y[i], z[i])
+                  for i in mesh.data[index]]
+        symbolic = float(Triangle(*points).get_volume())
+        assert np.isclose(symbolic, expected, rtol=1e-6, atol=1e-9), \
+            'triangle {}: sympy {} != analytic {}'.format(
+                index, symbolic, expected)
+
+    volume = mesh.get_volume(show_progress=False)
+    footprint = volume - mesh.get_cut_volume(1.0) + mesh.get_fill_volume(1.0)
+    curves = mesh.get_volume_curves(step=1.0, show_progress=False)
+    for (_, row) in curves.iterrows():
+        cut = mesh.get_cut_volume(row['ref_level'])
+        fill = mesh.get_fill_volume(row['ref_level'])
+        assert np.isclose(row['cut'], cut) and np.isclose(row['fill'], fill)
+        assert np.isclose(cut - fill, volume - footprint*row['ref_level'])
+
+def build_plots(survey):
+    """Builds every SurveyPlot figure without opening a browser."""
+    import plotly.offline as po
+    import volpy.plots
+    plot = po.plot
+    with tempfile.TemporaryDirectory() as directory:
+        def write(figure, filename):
+            return plot(figure,
+                        filename=os.path.join(directory, filename),
+                        auto_open=False)
+        volpy.plots.po.plot = write
+        try:
+            plots = volpy.terrain_plots(survey)
+            plots.scatter3d()
+            plots.contour()
+            plots.profile()
+            plots.mesh_plot()
+        finally:
+            volpy.plots.po.plot = plot
+
+def run_size(recorder, size, arguments):
+    """Runs every stage of the suite on a terrain with size points."""
+    terrain = generate_terrain(size, seed=arguments.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        sources = write_sources(terrain, directory)
+        surveys = {}
+        for ((extension, name), path) in sorted(sources.items()):
+            surveys[name] = recorder.run(
+                size, 'load {} {}'.format(extension, name),
+                Survey, path, name, CoordinateSystem[name])
+
+    survey = surveys['CARTESIAN']
+    mesh = recorder.run(size, 'TriangularMesh', volpy.TriangularMesh,
+                        survey.data)
+    recorder.run(size, 'get_volume', mesh.get_volume, show_progress=False)
+    ref_level = float(survey.data['z'].max())/2.0
+    recorder.run(size, 'get_cut_volume', mesh.get_cut_volume, ref_level)
+    recorder.run(size, 'get_fill_volume', mesh.get_fill_volume, ref_level)
+    recorder.run(size, 'get_volume_curves', mesh.get_volume_curves,
+                 step=1.0, show_progress=False)
+    if size <= arguments.max_plot_points:
+        recorder.run(size, 'SurveyPlot', build_plots, survey)
+    if size <= arguments.verify_points:
+        recorder.run(size, 'verify', verify, mesh, arguments.verify_triangles)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=float, nargs='+',
+                        default=[1e3, 1e4, 1e5],
+                        help='number of points of each terrain, up to 1e7')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-plot-points', type=float, default=1e3)
+    parser.add_argument('--verify-points', type=float, default=1e4)
+    parser.add_argument('--verify-triangles', type=int, default=50,
+                        help='triangles checked against the sympy reference')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='skip tracemalloc, which slows pure Python code')
+    parser.add_argument('--output', help='write the records as JSON')
+    arguments = parser.parse_args()
+
+    recorder = Recorder(track_memory=not arguments.no_memory)
+    print('{:>10} {:<36} {:>11} {:>10}'.format(
+        'points', 'stage', 'time', 'peak'))
+    for size in arguments.sizes:
+        run_size(recorder, int(size), arguments)
+
+    if arguments.output:
+        with open(arguments.output, 'w') as output:
+            json.dump(recorder.records, output, indent=2)
+
+if __name__ == '__main__':
+    main()
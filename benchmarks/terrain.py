@@ -0,0 +1,97 @@
+"""Reproducible synthetic terrains for the benchmark suite.
+
+A terrain is a pandas DataFrame with easting, northing and elevation columns.
+Points are spread over a square whose side grows with the number of points,
+so the density stays around one point per square meter at every size.
+"""
+import os
+import numpy as np
+import pandas as pd
+import utm
+
+# Projection used to write geographic sources: the zone of the sample survey.
+ZONE_NUMBER = 22
+ZONE_LETTER = 'J'
+ORIGIN = (460000.0, 7240000.0) # easting, northing
+
+def generate_terrain(points, seed=0):
+    """
+    Returns a DataFrame with easting, northing and elevation columns for a
+    rolling terrain made of a few hills, a slope and some noise.
+
+    :param points: (int) number of points.
+    :param seed: (int) seed of the random generator.
+    """
+    points = int(points)
+    generator = np.random.default_rng(seed)
+    side = max(10.0, np.sqrt(points))
+    x = generator.uniform(0.0, side, points)
+    y = generator.uniform(0.0, side, points)
+    hills = np.zeros(points)
+    for _ in range(5):
+        (center_x, center_y) = generator.uniform(0.0, side, 2)
+        radius = generator.uniform(0.1, 0.4)*side
+        height = generator.uniform(2.0, 15.0)
+        distance = ((x - center_x)**2 + (y - center_y)**2)/radius**2
+        hills += height*np.exp(-distance)
+    slope = 0.02*x + 0.01*y
+    noise = generator.normal(0.0, 0.05, points)
+    return pd.DataFrame({'easting': ORIGIN[0] + x,
+                         'northing': ORIGIN[1] + y,
+                         'elevation': 800.0 + hills + slope + noise})
+
+def get_geographic(terrain):
+    """Returns (latitudes, longitudes) of a terrain."""
+    return utm.to_latlon(terrain['easting'].to_numpy(),
+                         terrain['northing'].to_numpy(),
+                         ZONE_NUMBER,
+                         ZONE_LETTER)
+
+def write_sources(terrain, directory):
+    """
+    Writes the terrain in every supported source format and coordinate
+    system. Returns a dictionary {(extension, coordinate system name): path}.
+
+    :param terrain: DataFrame returned by generate_terrain.
+    :param directory: (str) output directory.
+    """
+    os.makedirs(directory, exist_ok=True)
+    (latitudes, longitudes) = get_geographic(terrain)
+    elevations = terrain['elevation'].to_numpy()
+    tables = {
+        'CARTESIAN': pd.DataFrame(
+            {'x': terrain['easting'] - ORIGIN[0],
+             'y': terrain['northing'] - ORIGIN[1],
+             'z': elevations}),
+        # volpy reads the UTM columns in the order utm.from_latlon returns.
+        'UTM': pd.DataFrame({'northing': terrain['easting'],
+                             'easting': terrain['northing'],
+                             'elevation': elevations}),
+        'GEOGRAPHIC': pd.DataFrame({'latitude': latitudes,
+                                    'longitude': longitudes,
+                                    'elevation': elevations}),
+    }
+    sources = {}
+    for (coordinate_system, table) in tables.items():
+        for extension in ['.csv', '.txt']:
+            path = os.path.join(directory, coordinate_system + extension)
+            table.to_csv(path, index=False)
+            sources[(extension, coordinate_system)] = path
+
+    path = os.path.join(directory, 'GEOGRAPHIC.gpx')
+    with open(path, 'w') as gpx:
+        gpx.write('<?xml version="1.0" encoding="UTF-8"?>'
+                  '<gpx xmlns="http://www.topografix.com/GPX/1/1">'
+                  '<trk><trkseg>\n')
+        for start in range(0, len(elevations), 100000):
+            stop = start + 100000
+            gpx.writelines(
+                '<trkpt lat="{:.10f}" lon="{:.10f}"><ele>{:.3f}</ele>'
+                '</trkpt>\n'.format(latitude, longitude, elevation)
+                for (latitude, longitude, elevation) in zip(
+                    latitudes[start:stop],
+                    longitudes[start:stop],
+                    elevations[start:stop]))
+        gpx.write('</trkseg></trk></gpx>\n')
+    sources[('.gpx', 'GEOGRAPHIC')] = path
+    return sources
@@ -0,0 +1,92 @@
+# python -m pytest test_difference.py
+import numpy as np
+import pandas as pd
+import pytest
+
+from volpy import Survey, TriangularMesh
+from volpy import get_difference_regions, get_difference_volumes
+source = '../volpy/sample_data/survey_ibema_faxinal_Cartesian.csv'
+
+
+def get_mesh(points, surface, seed):
+    """Returns a mesh of the square [0, 100] sampled at random points."""
+    generator = np.random.default_rng(seed)
+    xy = np.vstack(([[0.0, 0.0], [100.0, 0.0], [0.0, 100.0], [100.0, 100.0]],
+                    generator.uniform(0.0, 100.0, (points, 2))))
+    z = surface(xy[:, 0], xy[:, 1])
+    return TriangularMesh(pd.DataFrame({'x': xy[:, 0],
+                                        'y': xy[:, 1],
+                                        'z': z,
+                                        'elevation': z}))
+
+def plane(x, y):
+    return 0.1*x + 0.05*y + 3.0
+
+"""
+Test planar surfaces sampled at different points. The volumes between them
+are computed manually.
+"""
+test_cases = (('surface', 'expected'),
+[
+    (lambda x, y: plane(x, y) + 2.0, (0.0, 20000.0, 20000.0)),
+    (lambda x, y: 0.02*x + 2.0, (75000.0, 0.0, -75000.0)),
+    (lambda x, y: plane(x, y) + 0.1*(x - 50.0), (12500.0, 12500.0, 0.0)),
+])
+
+@pytest.mark.parametrize(*test_cases)
+def test_difference_volumes(surface, expected):
+    before = get_mesh(400, plane, 0)
+    after = get_mesh(300, surface, 1)
+    assert get_difference_volumes(before, after) == pytest.approx(expected)
+
+def test_difference_regions():
+    before = get_mesh(400, lambda x, y: np.sin(x/7.0) + np.cos(y/5.0), 0)
+    after = get_mesh(300, lambda x, y: np.sin(x/9.0) + np.cos(y/4.0), 1)
+    (cut, fill, net) = get_difference_volumes(before, after)
+    regions = get_difference_regions(before, after, 25.0)
+    assert list(regions.columns) == ['x_min', 'y_min', 'area', 'cut',
+                                     'fill', 'net']
+    assert len(regions) == 16
+    assert regions['area'].sum() == pytest.approx(10000.0)
+    assert regions['cut'].sum() == pytest.approx(cut)
+    assert regions['fill'].sum() == pytest.approx(fill)
+    assert regions['net'].sum() == pytest.approx(net)
+
+    halves = get_difference_regions(before, after, lambda x, y: x < 50.0)
+    assert list(halves['region']) == [False, True]
+    assert halves['net'].sum() == pytest.approx(net)
+    with pytest.raises(ValueError):
+        get_difference_regions(before, after, 0.0)
+
+def test_difference_partial_overlap():
+    before = get_mesh(300, plane, 0)
+    after = get_mesh(300, lambda x, y: plane(x, y) - 1.0, 1)
+    after.point_cloud['x'] = after.point_cloud['x'] + 50.0
+    after = TriangularMesh(after.point_cloud)
+    # the surfaces overlap over [50, 100] x [0, 100], where the one after
+    # lies 1.0 + 0.1*50 = 6.0 below the one before
+    assert get_difference_volumes(before, after) == pytest.approx(
+        (30000.0, 0.0, -30000.0))
+    assert get_difference_volumes(after, before) == pytest.approx(
+        (0.0, 30000.0, 30000.0))
+
+    after.point_cloud['x'] = after.point_cloud['x'] + 100.0
+    after = TriangularMesh(after.point_cloud)
+    assert get_difference_volumes(before, after) == (0.0, 0.0, 0.0)
+
+def test_difference_surveys(tmp_path):
+    before = Survey(source, 'before')
+    points = pd.read_csv(source)
+    points['z'] = points['z'] + 1.0
+    points.to_csv(str(tmp_path / 'after.csv'), index=False)
+    after = Survey(str(tmp_path / 'after.csv'), 'after')
+    # Each survey is relative to its own minimum elevation.
+    assert np.allclose(after.data['z'], before.data['z'])
+
+    mesh = TriangularMesh(before.data)
+    area = mesh._areas.sum()
+    assert get_difference_volumes(before, after) == pytest.approx(
+        (0.0, area, area))
+    assert get_difference_volumes(mesh, mesh) == (0.0, 0.0, 0.0)
+    with pytest.raises(TypeError):
+        get_difference_volumes(before, points)
@@ -1,15 +1,21 @@
+import os
 import pytest
 import numpy as np
+import pandas as pd
 from sympy import symbols
 
 from volpy import (
     CartesianCoordinate,
+    CartesianCoordinateBatch,
     CoordinateSystem,
+    HypsometricIndex,
     Line2D,
     Triangle,
+    TriangleBatch,
     TriangularMesh,
     Survey,
 )
+from volpy.geometry import _get_clipped_heights
 
 """
 Test Line2D correctly represents a line. Cases below were calculated manually.
@@ -44,6 +50,17 @@ def test_2dLine(point_A, point_B, input_x, output_y):
         output_y_calculated = float(line_equation.subs(x, input_x))
         assert output_y == pytest.approx(output_y_calculated, abs=0.01)
 
+@pytest.mark.parametrize(*test_cases)
+def test_2dLine_function(point_A, point_B, input_x, output_y):
+    line = Line2D(point_A, point_B).get_line_function()
+    if output_y is None:
+        assert line is None
+    else:
+        assert line(input_x) == pytest.approx(output_y, abs=0.01)
+        values = line(np.full(1000, input_x))
+        assert values.shape == (1000,)
+        assert np.allclose(values, output_y, atol=0.01)
+
 """
 Test the subtraction of Cartesian Coordinates
 """
@@ -87,6 +104,24 @@ def test_plane_equation(point_A, point_B, point_C, input_y, input_x, output_z):
     output_z_calculated = float(plane.subs([(x, input_x), (y, input_y)]))
     assert output_z_calculated == pytest.approx(output_z, abs=0.01)
 
+@pytest.mark.parametrize(*test_cases)
+def test_plane_function(point_A, point_B, point_C, input_y, input_x, output_z):
+    triangle = Triangle(point_A, point_B, point_C)
+    plane = triangle.get_plane_function()
+    assert plane(input_x, input_y) == pytest.approx(output_z, abs=0.01)
+    values = plane(np.full(1000, input_x), np.full(1000, input_y))
+    assert np.allclose(values, output_z, atol=0.01)
+    (a, b, c) = triangle.get_plane_coefficients()
+    for point in [point_A, point_B, point_C]:
+        assert a*point.x + b*point.y + c == pytest.approx(point.z)
+
+def test_vertical_plane_function():
+    triangle = Triangle(CartesianCoordinate(0, 0, 0),
+                        CartesianCoordinate(1, 1, 0),
+                        CartesianCoordinate(2, 2, 5))
+    assert triangle.get_plane_coefficients() is None
+    assert triangle.get_plane_function() is None
+
 """
 Test volume of a triangle is calculated as expected.
 """
@@ -145,6 +180,46 @@ def test_cartesian_sorting(point_A, point_B):
     assert array[0] == point_A
     assert array[1] == point_B
 
+"""Test batches of triangles match the single object computations"""
+def test_triangle_batch():
+    triangles = [Triangle(*points) for points in [
+        (CartesianCoordinate(3, 0, 8),
+         CartesianCoordinate(5, 9, 1),
+         CartesianCoordinate(10, 4, 7)),
+        (CartesianCoordinate(5, 0, 20),
+         CartesianCoordinate(0, 10, 20),
+         CartesianCoordinate(0, 0, 20)),
+        (CartesianCoordinate(15, 10, 20),
+         CartesianCoordinate(5, 5, 20),
+         CartesianCoordinate(10,15, 20)),
+    ]]
+    batch = TriangleBatch.from_triangles(triangles)
+    assert len(batch) == 3
+    assert np.allclose(batch.get_volume(), [146.67, 500.0, 750.0], atol=0.05)
+    (a, b, c) = batch.get_plane_coefficients()
+    assert a[0]*18 + b[0]*32 + c[0] == pytest.approx(-14.164, abs=0.01)
+    assert np.allclose(a[1:], 0.0) and np.allclose(c[1:], 20.0)
+    assert batch[0].point_B == triangles[0].point_B
+    assert len(batch[1:]) == 2
+
+def test_triangle_batch_from_points():
+    survey = Survey('../volpy/sample_data/survey_delaunay_Cartesian.csv')
+    mesh = TriangularMesh(survey.data)
+    points = CartesianCoordinateBatch.from_dataframe(survey.data)
+    batch = TriangleBatch.from_points(points, mesh.data)
+    assert np.allclose(batch.get_projected_areas(), mesh._areas)
+    assert batch.get_volume().sum() == pytest.approx(
+        mesh.get_volume(show_progress=False))
+    vectors = points[mesh.data[:, 1]] - points[mesh.data[:, 0]]
+    assert np.allclose(np.cross(vectors, points[mesh.data[:, 2]] -
+                                         points[mesh.data[:, 1]]),
+                       batch.get_normal_vectors())
+
+def test_slotted_objects():
+    point = CartesianCoordinate(1, 2, 3)
+    for item in [point, Line2D(point, point), Triangle(point, point, point)]:
+        assert not hasattr(item, '__dict__')
+
 """Test Mesh Volume"""
 def test_mesh_volume():
     source = '../volpy/sample_data/survey_delaunay_Cartesian.csv'
@@ -155,10 +230,372 @@ def test_mesh_volume():
     expected_volume = 168.0-(13.0*4.0*1.0)
     assert mesh.get_volume() == pytest.approx(expected_volume, rel=0.01)
 
+"""Test the analytic volume engine against the symbolic reference"""
+def test_mesh_volume_analytic_matches_symbolic():
+    source = '../volpy/sample_data/survey_delaunay_Cartesian.csv'
+    survey = Survey(source,
+                    'sample',
+                    coordinate_system=CoordinateSystem.CARTESIAN)
+    mesh = TriangularMesh(survey.data)
+    analytic = mesh.get_volume(show_progress=False)
+    symbolic = mesh.get_volume(show_progress=False, method='symbolic')
+    assert analytic == pytest.approx(float(symbolic), rel=1e-9)
+
+def test_mesh_volume_unknown_method():
+    source = '../volpy/sample_data/survey_delaunay_Cartesian.csv'
+    survey = Survey(source, 'sample')
+    mesh = TriangularMesh(survey.data)
+    with pytest.raises(ValueError):
+        mesh.get_volume(method='bla')
+
+"""Test the Delaunay topology is built once and reused"""
+def test_mesh_topology_reuse(monkeypatch):
+    import volpy.geometry
+    calls = []
+    delaunay = volpy.geometry.Delaunay
+    def counting_delaunay(points):
+        calls.append(len(points))
+        return delaunay(points)
+    monkeypatch.setattr(volpy.geometry, 'Delaunay', counting_delaunay)
+
+    source = '../volpy/sample_data/survey_ibema_faxinal_Cartesian.csv'
+    survey = Survey(source, 'sample')
+    mesh = TriangularMesh(survey.data)
+    mesh.get_volume(show_progress=False)
+    mesh.get_cut_volume(2.0, show_progress=False)
+    mesh.get_fill_volume(2.0, show_progress=False)
+    mesh.get_volume_curves(step=5.0)
+    assert len(calls) == 1
+
+    # Changing z alone keeps the topology; changing x/y rebuilds it.
+    mesh.point_cloud['z'] = mesh.point_cloud['z'] + 1.0
+    mesh.get_volume(show_progress=False)
+    assert len(calls) == 1
+    mesh.point_cloud['x'] = mesh.point_cloud['x'] * 2.0
+    mesh.get_volume(show_progress=False)
+    assert len(calls) == 2
+
+"""Test a mesh is saved and reopened without triangulating again"""
+def test_mesh_save_load(tmp_path, monkeypatch):
+    import volpy.geometry
+    source = '../volpy/sample_data/survey_ibema_faxinal_Cartesian.csv'
+    survey = Survey(source, 'sample')
+    mesh = TriangularMesh(survey.data)
+    path = str(tmp_path / 'mesh')
+    mesh.save(path)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('triangulated again')
+    monkeypatch.setattr(volpy.geometry, 'Delaunay', fail)
+    for point_cloud in [None, survey.data]:
+        cached = TriangularMesh.load(path, point_cloud)
+        assert isinstance(cached.data, np.memmap)
+        assert np.array_equal(cached.data, mesh.data)
+        assert cached.get_volume() == pytest.approx(mesh.get_volume())
+        assert cached.get_cut_volume(3.0) == pytest.approx(
+            mesh.get_cut_volume(3.0))
+
+    # saved again over the memory mapped files it was loaded from
+    cached = TriangularMesh.load(path)
+    cached.save(path)
+    cached = TriangularMesh.load(path)
+    assert np.array_equal(cached.data, mesh.data)
+    assert np.array_equal(cached.point_cloud, mesh.point_cloud)
+    assert cached.get_volume() == pytest.approx(mesh.get_volume())
+    assert sorted(os.listdir(path)) == ['areas.npy', 'mesh.json',
+                                        'points.npy', 'simplices.npy']
+
+    other = survey.data.copy()
+    other.loc[0, 'z'] += 1.0
+    with pytest.raises(ValueError):
+        TriangularMesh.load(path, other)
+
+"""Test appended points update the mesh and cached volumes like a rebuild"""
+@pytest.mark.parametrize('loaded', [False, True])
+def test_mesh_add_points(tmp_path, loaded):
+    source = '../volpy/sample_data/survey_ibema_faxinal_Cartesian.csv'
+    survey = Survey(source, 'sample')
+    mesh = TriangularMesh(survey.data.iloc[:100].reset_index(drop=True))
+    if loaded:
+        mesh.save(str(tmp_path / 'mesh'))
+        mesh = TriangularMesh.load(str(tmp_path / 'mesh'))
+    mesh.get_volume()
+    mesh.get_cut_volume(3.0)
+    mesh.get_volume_curves(step=1.0, show_progress=False)
+    for (start, stop) in [(100, 130), (130, len(survey.data))]:
+        mesh.add_points(survey.data.iloc[start:stop])
+
+    rebuilt = TriangularMesh(survey.data)
+    assert len(mesh.point_cloud) == len(survey.data)
+    assert (set(map(tuple, np.sort(mesh.data, axis=1))) ==
+            set(map(tuple, np.sort(rebuilt.data, axis=1))))
+    assert mesh._results['volume'] == pytest.approx(rebuilt.get_volume())
+    assert mesh.get_cut_volume(3.0) == pytest.approx(
+        rebuilt.get_cut_volume(3.0))
+    pd.testing.assert_frame_equal(
+        mesh.get_volume_curves(step=1.0, show_progress=False),
+        rebuilt.get_volume_curves(step=1.0, show_progress=False))
+    assert mesh.get_elevation(10.0, 10.0) == pytest.approx(
+        rebuilt.get_elevation(10.0, 10.0), nan_ok=True)
+
+    with pytest.raises(ValueError):
+        mesh.add_points(survey.data[['x', 'y']])
+
+def test_mesh_add_points_index():
+    source = '../volpy/sample_data/survey_ibema_faxinal_Cartesian.csv'
+    survey = Survey(source, 'sample')
+    count = len(survey.data) - 6
+    mesh = TriangularMesh(survey.data.iloc[:count].reset_index(drop=True))
+    index = mesh.get_index()
+    for start in range(count, len(survey.data), 2):
+        mesh.add_points(survey.data.iloc[start:start + 2])
+    # a few points update the index in place
+    assert mesh.get_index() is index
+    assert len(index.changes) == 6
+    assert len(index) == mesh.triangular_areas
+
+    rebuilt = TriangularMesh(survey.data)
+    levels = np.linspace(-1.0, survey.data['z'].max() + 1.0, 301)
+    assert np.allclose(index.get_cut_fill_volumes(levels),
+                       rebuilt.get_index().get_cut_fill_volumes(levels),
+                       rtol=1e-9, atol=1e-6)
+    assert index.get_area() == pytest.approx(rebuilt._areas.sum())
+    pd.testing.assert_frame_equal(
+        mesh.get_volume_curves(step=0.01, show_progress=False, workers=2),
+        rebuilt.get_volume_curves(step=0.01, show_progress=False))
+
+"""Test the batched volume curves match the per level cut/fill routines"""
+def test_volume_curves():
+    source = '../volpy/sample_data/survey_ibema_faxinal_Cartesian.csv'
+    survey = Survey(source, 'sample')
+    mesh = TriangularMesh(survey.data)
+    curves = mesh.get_volume_curves(step=0.5, show_progress=False)
+    assert list(curves.columns) == ['ref_level', 'cut', 'fill']
+    assert curves['cut'].dtype == np.float64
+    assert curves['cut'].iloc[0] == pytest.approx(
+        mesh.get_volume(show_progress=False))
+    assert curves['fill'].iloc[0] == 0.0
+    for _, row in curves.iloc[::5].iterrows():
+        cut = mesh.get_cut_volume(row['ref_level'], show_progress=False)
+        fill = mesh.get_fill_volume(row['ref_level'], show_progress=False)
+        assert row['cut'] == pytest.approx(cut, abs=1.0)
+        assert row['fill'] == pytest.approx(fill, abs=1.0)
+
+"""Test a flat mesh has no levels to report"""
+@pytest.mark.parametrize('method', ['analytic', 'grid'])
+def test_flat_volume_curves(method):
+    point_cloud = pd.DataFrame({'x': [0.0, 1.0, 0.0, 1.0],
+                                'y': [0.0, 0.0, 1.0, 1.0],
+                                'z': [0.0, 0.0, 0.0, 0.0]})
+    point_cloud['elevation'] = point_cloud['z']
+    mesh = TriangularMesh(point_cloud)
+    curves = mesh.get_volume_curves(method=method, cell_size=0.25)
+    assert list(curves.columns) == ['ref_level', 'cut', 'fill']
+    assert len(curves) == 0
+
+"""Test the parallel volume curves match the single process ones"""
+def test_parallel_volume_curves():
+    source = '../volpy/sample_data/survey_ibema_faxinal_Cartesian.csv'
+    survey = Survey(source, 'sample')
+    mesh = TriangularMesh(survey.data)
+    expected = mesh.get_volume_curves(step=0.01, show_progress=False)
+    reports = []
+    curves = mesh.get_volume_curves(step=0.01,
+                                    show_progress=lambda done, total:
+                                        reports.append(done),
+                                    workers=2)
+    pd.testing.assert_frame_equal(curves, expected)
+    assert reports[-1] == len(curves)
+
 """Test Cut and Fill Volumes"""
-# RESUME HERE
-def test_cut_volume():
-    assert 1 == 1
+def get_single_triangle_mesh():
+    point_cloud = pd.DataFrame({'x': [0.0, 1.0, 0.0],
+                                'y': [0.0, 0.0, 1.0],
+                                'z': [0.0, 0.0, 3.0]})
+    point_cloud['elevation'] = point_cloud['z']
+    return TriangularMesh(point_cloud)
+
+test_cases = (
+    ('ref_level', 'expected_cut', 'expected_fill'),
+    [
+        (0.0, 0.5, 0.0), # whole prism is cut
+        (1.5, 0.0625, 0.3125), # plane straddles the triangle
+        (3.0, 0.0, 1.0), # whole footprint is fill
+        (4.0, 0.0, 1.5),
+    ]
+)
+
+@pytest.mark.parametrize(*test_cases)
+def test_cut_fill_volume(ref_level, expected_cut, expected_fill):
+    mesh = get_single_triangle_mesh()
+    cut = mesh.get_cut_volume(ref_level)
+    fill = mesh.get_fill_volume(ref_level)
+    assert cut == pytest.approx(expected_cut)
+    assert fill == pytest.approx(expected_fill)
+
+def test_cut_fill_balance():
+    source = '../volpy/sample_data/survey_ibema_faxinal_Cartesian.csv'
+    survey = Survey(source, 'sample')
+    mesh = TriangularMesh(survey.data)
+    volume = mesh.get_volume(show_progress=False)
+    footprint = volume - mesh.get_cut_volume(1.0) + mesh.get_fill_volume(1.0)
+    for ref_level in [2.5, 7.0, 12.3]:
+        cut = mesh.get_cut_volume(ref_level)
+        fill = mesh.get_fill_volume(ref_level)
+        assert cut >= 0.0 and fill >= 0.0
+        # Both sides of the plane always add up to the terrain volume.
+        assert cut - fill == pytest.approx(volume - footprint*ref_level)
+
+"""Test the hypsometric index matches clipping every triangle at each level"""
+def get_clipped_volumes(z_sorted, areas, levels):
+    (above, mean) = _get_clipped_heights(z_sorted, levels)
+    cut = above @ areas
+    return (cut, cut - mean @ areas)
+
+def test_hypsometric_index():
+    source = '../volpy/sample_data/survey_ibema_faxinal_Cartesian.csv'
+    survey = Survey(source, 'sample')
+    mesh = TriangularMesh(survey.data)
+    z = mesh.point_cloud['z'].to_numpy()
+    levels = np.concatenate(([-1.0], np.linspace(0.0, z.max() + 1.0, 97), z))
+    index = mesh.get_index()
+    assert len(index) == mesh.triangular_areas
+    expected = get_clipped_volumes(np.sort(z[mesh.data], axis=1),
+                                   mesh._areas,
+                                   levels)
+    assert np.allclose(index.get_cut_fill_volumes(levels), expected,
+                       rtol=1e-9, atol=1e-6)
+    assert mesh.get_index() is index
+
+    # vertices a hair apart are kept out of the cumulative polynomials
+    z = np.sort(z[mesh.data], axis=1)
+    z[::2, 1] = z[::2, 0] + 1e-7
+    z[::3, 2] = z[::3, 1] + 1e-7
+    index = HypsometricIndex(z, mesh._areas)
+    assert index.windows.shape[1] > 0
+    levels = np.concatenate((levels, z[::2, 0] + 5e-8, z[::3, 1] + 5e-8))
+    expected = get_clipped_volumes(z, mesh._areas, levels)
+    assert np.allclose(index.get_cut_fill_volumes(levels), expected,
+                       rtol=1e-9, atol=1e-6)
+
+    # a change to z builds the index again
+    index = mesh.get_index()
+    mesh.point_cloud['z'] = mesh.point_cloud['z'] + 1.0
+    assert mesh.get_index() is not index
+    assert mesh.get_cut_volume(1.0) == pytest.approx(
+        mesh.get_volume() - mesh._areas.sum())
+
+"""Test the solved levels meet their swollen cut/fill targets"""
+@pytest.mark.parametrize('swell_factor', [1.0, 1.25, 0.8])
+def test_balance_level(swell_factor):
+    source = '../volpy/sample_data/survey_ibema_faxinal_Cartesian.csv'
+    survey = Survey(source, 'sample')
+    mesh = TriangularMesh(survey.data)
+    def get_excess(level):
+        return (swell_factor*mesh.get_cut_volume(level) -
+                mesh.get_fill_volume(level))
+
+    level = mesh.get_balance_level(swell_factor, tolerance=1e-9)
+    assert get_excess(level) == pytest.approx(0.0, abs=1e-3)
+    # within and beyond the range of elevations of the survey
+    for net_volume in [5000.0, -1e7, 1e7]:
+        level = mesh.get_target_level(net_volume, swell_factor,
+                                      tolerance=1e-9)
+        assert get_excess(level) == pytest.approx(net_volume, abs=1e-3)
+    grid_level = mesh.get_balance_level(swell_factor, method='grid',
+                                        cell_size=0.5)
+    assert grid_level == pytest.approx(mesh.get_balance_level(swell_factor),
+                                       abs=0.05)
+
+def test_balance_level_errors():
+    mesh = get_single_triangle_mesh()
+    for arguments in [{'swell_factor': 0.0},
+                      {'tolerance': 0.0},
+                      {'method': 'symbolic'}]:
+        with pytest.raises(ValueError):
+            mesh.get_balance_level(**arguments)
+
+"""Test elevation queries interpolate the mesh surface"""
+def test_mesh_elevation():
+    generator = np.random.default_rng(0)
+    point_cloud = pd.DataFrame({'x': generator.uniform(0.0, 10.0, 200),
+                                'y': generator.uniform(0.0, 10.0, 200)})
+    point_cloud['z'] = 2.0*point_cloud['x'] - point_cloud['y'] + 5.0
+    point_cloud['elevation'] = point_cloud['z']
+    mesh = TriangularMesh(point_cloud)
+
+    # vertices are returned as they are
+    z = mesh.get_elevation(point_cloud['x'], point_cloud['y'])
+    assert np.allclose(z, point_cloud['z'])
+
+    # a planar terrain is interpolated exactly, in any chunk size
+    x = generator.uniform(2.0, 8.0, 1000)
+    y = generator.uniform(2.0, 8.0, 1000)
+    for chunk_size in [7, 2**20]:
+        z = mesh.get_elevation(x, y, chunk_size=chunk_size)
+        assert np.allclose(z, 2.0*x - y + 5.0)
+    assert mesh.get_elevation(5.0, 5.0) == pytest.approx(10.0)
+    assert mesh.get_elevation(x.reshape(10, 100), 5.0).shape == (10, 100)
+
+def test_mesh_elevation_outside():
+    mesh = get_single_triangle_mesh()
+    z = mesh.get_elevation([0.25, 2.0], [0.25, 2.0])
+    assert z[0] == pytest.approx(0.75)
+    assert np.isnan(z[1])
+    assert mesh.get_elevation(2.0, 2.0, fill_value=-1.0) == -1.0
+    with pytest.raises(ValueError):
+        mesh.get_elevation([0.25, 2.0], [0.25, 2.0], outside='raise')
+
+def test_mesh_elevation_loaded(tmp_path):
+    source = '../volpy/sample_data/survey_delaunay_Cartesian.csv'
+    survey = Survey(source, 'sample')
+    mesh = TriangularMesh(survey.data)
+    mesh.save(str(tmp_path / 'mesh'))
+    cached = TriangularMesh.load(str(tmp_path / 'mesh'))
+    x = survey.data['x'].to_numpy()
+    y = survey.data['y'].to_numpy()
+    (x, y) = ((x[:-1] + x[1:])/2.0, (y[:-1] + y[1:])/2.0)
+    assert np.allclose(cached.get_elevation(x, y), mesh.get_elevation(x, y),
+                       equal_nan=True)
+
+"""Test the grid volume method stays within its error estimate"""
+def test_grid_volume():
+    source = '../volpy/sample_data/survey_ibema_faxinal_Cartesian.csv'
+    survey = Survey(source, 'sample')
+    mesh = TriangularMesh(survey.data)
+    exact = mesh.get_volume(show_progress=False)
+    (volume, error) = mesh.get_volume(method='grid', cell_size=0.5,
+                                      return_error=True)
+    assert error > 0.0
+    assert abs(volume - exact) <= error
+    assert abs(volume - exact) <= 1e-3*exact
+    assert mesh.get_volume(return_error=True) == (exact, 0.0)
+
+    for ref_level in [2.5, 7.0]:
+        for volume_method in [mesh.get_cut_volume, mesh.get_fill_volume]:
+            exact = volume_method(ref_level)
+            (volume, error) = volume_method(ref_level, method='grid',
+                                            cell_size=0.5,
+                                            return_error=True)
+            assert abs(volume - exact) <= max(error, 1e-3*exact)
+
+def test_grid_volume_curves():
+    source = '../volpy/sample_data/survey_ibema_faxinal_Cartesian.csv'
+    survey = Survey(source, 'sample')
+    mesh = TriangularMesh(survey.data)
+    exact = mesh.get_volume_curves(step=1.0, show_progress=False)
+    curves = mesh.get_volume_curves(step=1.0, show_progress=False,
+                                    method='grid', cell_size=0.5,
+                                    return_error=True)
+    assert list(curves.columns) == ['ref_level', 'cut', 'fill',
+                                    'cut_error', 'fill_error']
+    assert np.allclose(curves['cut'], exact['cut'], rtol=1e-3, atol=10.0)
+    assert np.allclose(curves['fill'], exact['fill'], rtol=1e-3, atol=10.0)
+    assert (curves['cut_error'] >= 0.0).all()
 
-def test_fill_volume():
-    assert 1 == 1
+def test_grid_volume_unknown_method():
+    mesh = get_single_triangle_mesh()
+    with pytest.raises(ValueError):
+        mesh.get_cut_volume(1.0, method='symbolic')
+    with pytest.raises(ValueError):
+        mesh.get_volume_curves(method='unknown')
@@ -0,0 +1,37 @@
+# python -m pytest test_imports.py
+import os
+import subprocess
+import sys
+
+def get_loaded_modules(statement, modules):
+    """
+    Runs statement in a fresh interpreter and returns which of the given
+    top level modules it loaded.
+    """
+    code = ('import sys\n' + statement + '\n' +
+            'print(" ".join(m for m in {!r} if m in sys.modules))'.format(
+                modules))
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = os.pathsep.join(sys.path)
+    result = subprocess.run([sys.executable, '-c', code],
+                            env=environment,
+                            capture_output=True,
+                            text=True,
+                            check=True)
+    return result.stdout.split()
+
+def test_import_is_lazy():
+    loaded = get_loaded_modules('import volpy',
+                                ['scipy', 'sympy', 'plotly', 'pkg_resources'])
+    assert loaded == []
+
+def test_mesh_import_is_lazy():
+    loaded = get_loaded_modules('import volpy; volpy.TriangularMesh',
+                                ['sympy', 'plotly'])
+    assert loaded == []
+
+def test_lazy_attributes():
+    import volpy
+    assert os.path.isfile(volpy.sample)
+    assert volpy.terrain_mesh is volpy.TriangularMesh
+    assert volpy.terrain_plots.__name__ == 'SurveyPlot'
@@ -0,0 +1,47 @@
+# python -m pytest test_instrumentation.py
+
+from volpy import Survey
+from volpy import TriangularMesh
+from volpy import instrumentation
+source = '../volpy/sample_data/survey_ibema_faxinal_Geographic.csv'
+
+
+def test_disabled_stage_is_shared_noop():
+    assert instrumentation.stage('a') is instrumentation.stage('b')
+
+def test_stage_metrics():
+    from volpy import CoordinateSystem
+    events = []
+    with instrumentation.enable(callback=events.append) as metrics:
+        survey = Survey(source, 'sample', CoordinateSystem.GEOGRAPHIC)
+        mesh = TriangularMesh(survey.data)
+        mesh.get_volume()
+        mesh.get_cut_volume(2.0)
+        mesh.get_fill_volume(2.0)
+        mesh.get_volume_curves(step=1.0, show_progress=False)
+    assert instrumentation.stage('after') is instrumentation.stage('exit')
+
+    stages = metrics.metrics
+    assert stages['survey.read_txt']['items'] == {'points': 155}
+    assert stages['survey.utm']['items'] == {'points': 155}
+    triangles = mesh.triangular_areas
+    assert stages['mesh.triangulate']['calls'] == 1
+    assert stages['mesh.triangulate']['items'] == {'points': 155,
+                                                   'triangles': triangles}
+    assert stages['mesh.cut_fill']['calls'] == 2
+    # cut/fill and the curves share the index built on the first query
+    assert stages['mesh.index']['calls'] == 1
+    assert stages['mesh.curves']['items']['levels'] == 19
+    assert stages['mesh.volume']['peak_memory'] is None
+    assert [event['stage'] for event in events][:2] == ['survey.utm',
+                                                       'survey.read_txt']
+    assert 'mesh.curves' in metrics.summary()
+
+def test_stage_memory():
+    with instrumentation.enable(track_memory=True) as metrics:
+        with instrumentation.stage('outer'):
+            with instrumentation.stage('inner'):
+                block = bytearray(2**22)
+                del block
+    assert metrics.metrics['inner']['peak_memory'] >= 2**22
+    assert metrics.metrics['outer']['peak_memory'] >= 2**22
@@ -0,0 +1,26 @@
+# python -m pytest test_plots.py
+import numpy as np
+import plotly.graph_objs as go
+
+from volpy import Survey, TriangularMesh
+from volpy.plots import SurveyPlot
+source = '../volpy/sample_data/survey_ibema_faxinal_Cartesian.csv'
+
+
+def test_mesh_trace():
+    survey = Survey(source, 'sample')
+    mesh = TriangularMesh(survey.data)
+    trace = SurveyPlot(survey).mesh_trace(mesh)
+    assert isinstance(trace, go.Scattergl)
+    # every edge once, as a pair of points followed by a gap
+    x = np.asarray(trace.x).reshape(-1, 3)
+    y = np.asarray(trace.y).reshape(-1, 3)
+    assert np.isnan(x[:, 2]).all() and np.isnan(y[:, 2]).all()
+    hull = len(mesh._get_hull())
+    assert len(x) == (3*mesh.triangular_areas + hull)//2
+    edges = set(map(tuple, np.column_stack((x[:, :2], y[:, :2]))))
+    assert len(edges) == len(x)
+
+    trace = SurveyPlot(survey).mesh_trace(webgl=False)
+    assert isinstance(trace, go.Scatter)
+    assert np.array_equal(np.asarray(trace.x), x.ravel(), equal_nan=True)
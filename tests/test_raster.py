@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from volpy import Raster, Survey, TriangularMesh
+
+def get_planar_mesh():
+    generator = np.random.default_rng(0)
+    point_cloud = pd.DataFrame({'x': generator.uniform(0.0, 10.0, 200),
+                                'y': generator.uniform(0.0, 20.0, 200)})
+    point_cloud['z'] = 2.0*point_cloud['x'] - point_cloud['y'] + 50.0
+    point_cloud['elevation'] = point_cloud['z']
+    return TriangularMesh(point_cloud)
+
+def test_rasterize():
+    mesh = get_planar_mesh()
+    raster = mesh.rasterize(0.5,
+                            bounds=(2.0, 4.0, 8.0, 16.0),
+                            tile_rows=5,
+                            dtype=np.float64)
+    assert raster.shape == (24, 12)
+    assert raster.origin == (2.0, 16.0)
+    (x, y) = np.meshgrid(raster.get_x(), raster.get_y())
+    assert x[0, 0] == 2.25 and y[0, 0] == 15.75
+    assert np.allclose(raster.elevation, 2.0*x - y + 50.0)
+
+def test_rasterize_outside():
+    mesh = get_planar_mesh()
+    raster = mesh.rasterize(1.0, bounds=(-5.0, -5.0, 15.0, 25.0),
+                            fill_value=-9999.0)
+    assert raster.elevation.dtype == np.float32
+    assert raster.elevation[0, 0] == -9999.0
+    assert raster.elevation[15, 10] != -9999.0
+
+def test_rasterize_to_disk(tmp_path):
+    source = '../volpy/sample_data/survey_ibema_faxinal_Cartesian.csv'
+    survey = Survey(source, 'sample')
+    mesh = TriangularMesh(survey.data)
+    expected = mesh.rasterize(2.0, offset=survey.offset)
+    path = str(tmp_path / 'dem')
+    written = mesh.rasterize(2.0, path=path, tile_rows=3,
+                             offset=survey.offset)
+    assert isinstance(written.elevation, np.memmap)
+
+    raster = Raster.load(path)
+    assert isinstance(raster.elevation, np.memmap)
+    np.testing.assert_array_equal(raster.elevation, expected.elevation)
+    assert raster.origin == expected.origin
+    assert raster.cell_size == 2.0
+    assert raster.offset == survey.offset
+    assert raster.utm_zone is None
+    assert np.isnan(raster.fill_value)
+
+def test_rasterize_invalid_cell_size():
+    with pytest.raises(ValueError):
+        get_planar_mesh().rasterize(0.0)
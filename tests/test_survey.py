@@ -1,10 +1,12 @@
 # python -m pytest test_survey.py
 # python -m pytest --verbose
 import pytest
+import numpy as np
 import pandas as pd
 
 from volpy import Survey
 from volpy import CoordinateSystem
+from volpy.coordinates import UtmCoordinate
 sample_directory = '../volpy/sample_data/'
 
 
@@ -79,3 +81,118 @@ def test_import_error(source, error_type, coordinate_system):
         source = sample_directory + source
         with pytest.raises(error_type):
             _ = Survey(source, 'sample', coordinate_system)
+
+# Bulk UTM conversion tests
+def test_utm_array_conversion():
+    latitudes = np.array([-24.9361964688, -24.9373412691, -24.9356161896])
+    longitudes = np.array([-51.3905997667, -51.3912213687, -51.3915946148])
+    elevations = np.array([883.16, 870.63, 875.60])
+    bulk = UtmCoordinate.create_from_geographic_array(latitudes,
+                                                      longitudes,
+                                                      elevations)
+    assert (bulk.zone_number, bulk.zone_letter) == (22, 'J')
+    for i in range(len(latitudes)):
+        single = UtmCoordinate.create_from_geographic(latitudes[i],
+                                                      longitudes[i],
+                                                      elevations[i])
+        assert bulk.northing[i] == pytest.approx(single.northing)
+        assert bulk.easting[i] == pytest.approx(single.easting)
+        assert bulk.elevation[i] == single.elevation
+
+def test_utm_array_single_zone():
+    # Points on both sides of the 21/22 zone boundary at 54 degrees west.
+    latitudes = np.array([-25.0, -25.0])
+    longitudes = np.array([-54.01, -53.99])
+    bulk = UtmCoordinate.create_from_geographic_array(latitudes,
+                                                      longitudes,
+                                                      [0.0, 0.0])
+    assert bulk.zone_number in (21, 22)
+    # Projected into the same zone the points stay ~2 km apart.
+    distance = np.hypot(bulk.northing[0] - bulk.northing[1],
+                        bulk.easting[0] - bulk.easting[1])
+    assert distance == pytest.approx(2017, abs=10)
+
+# Streaming GPX parser tests
+def test_gpx_chunked_parse(monkeypatch):
+    import volpy.survey
+    source = sample_directory + 'survey_ibema_faxinal.gpx'
+    expected = Survey(source, 'sample', CoordinateSystem.GEOGRAPHIC).data
+    monkeypatch.setattr(volpy.survey, 'GPX_CHUNK_SIZE', 10)
+    survey = Survey(source, 'sample', CoordinateSystem.GEOGRAPHIC)
+    pd.testing.assert_frame_equal(survey.data, expected)
+
+def test_gpx_forbids_entities(tmp_path):
+    from defusedxml import EntitiesForbidden
+    source = tmp_path / 'entities.gpx'
+    source.write_text(
+        '<?xml version="1.0"?>'
+        '<!DOCTYPE gpx [<!ENTITY ele "880.68">]>'
+        '<gpx><trk><trkseg><trkpt lat="-24.9" lon="-51.3">'
+        '<ele>&ele;</ele></trkpt></trkseg></trk></gpx>')
+    with pytest.raises(EntitiesForbidden):
+        _ = Survey(str(source), 'sample', CoordinateSystem.GEOGRAPHIC)
+
+# Chunked CSV/TXT ingestion tests
+test_cases = (('source', 'coordinate_system'),
+[
+('survey_ibema_faxinal_Geographic.csv', CoordinateSystem.GEOGRAPHIC),
+('survey_ibema_faxinal_UTM.txt', CoordinateSystem.UTM),
+('survey_ibema_faxinal_Cartesian.csv', CoordinateSystem.CARTESIAN),
+])
+
+@pytest.mark.parametrize(*test_cases)
+def test_chunked_import(source, coordinate_system):
+    source = sample_directory + source
+    expected = Survey(source, 'sample', coordinate_system)
+    survey = Survey(source, 'sample', coordinate_system, chunksize=16)
+    pd.testing.assert_frame_equal(survey.data, expected.data)
+    assert survey.offset == expected.offset
+    assert verify_survey_dtypes(survey) == True
+
+def test_chunked_import_error():
+    source = sample_directory + 'survey_ibema_faxinal_UTM_wrong_entry.csv'
+    with pytest.raises(ValueError):
+        _ = Survey(source, 'sample', CoordinateSystem.UTM, chunksize=16)
+
+# Binary sidecar cache tests
+def test_survey_cache(tmp_path, monkeypatch):
+    import shutil
+    source = str(tmp_path / 'survey.csv')
+    shutil.copy(sample_directory + 'survey_ibema_faxinal_Geographic.csv',
+                source)
+    cache_dir = str(tmp_path / 'cache')
+    expected = Survey(source, 'sample', CoordinateSystem.GEOGRAPHIC,
+                      cache_dir=cache_dir)
+
+    # Warm load: no parse happens.
+    def fail(*args, **kwargs):
+        raise AssertionError('source parsed again')
+    with monkeypatch.context() as patch:
+        patch.setattr(Survey, '_read_txt', fail)
+        survey = Survey(source, 'sample', CoordinateSystem.GEOGRAPHIC,
+                        cache_dir=cache_dir)
+    pd.testing.assert_frame_equal(survey.data, expected.data)
+    assert survey.offset == expected.offset
+    assert survey.utm_zone == expected.utm_zone
+
+    # A different coordinate system or a modified source invalidates it.
+    with pytest.raises(ValueError):
+        _ = Survey(source, 'sample', CoordinateSystem.UTM,
+                   cache_dir=cache_dir)
+    with open(source, 'a') as source_file:
+        source_file.write('-24.9356161896,-51.3915946148,860.0\n')
+    survey = Survey(source, 'sample', CoordinateSystem.GEOGRAPHIC,
+                    cache_dir=cache_dir)
+    assert survey.data.shape[0] == expected.data.shape[0] + 1
+    assert survey.offset[2] == 860.0
+
+def test_get_data_offset():
+    survey = Survey(sample_directory + 'survey_ibema_faxinal_UTM.csv',
+                    'sample', CoordinateSystem.UTM)
+    pd.testing.assert_frame_equal(survey.get_data(), survey.data)
+    offset = (survey.offset[0] - 1.0, survey.offset[1], survey.offset[2] + 2.0)
+    data = survey.get_data(offset)
+    assert np.allclose(data['x'], survey.data['x'] + 1.0)
+    assert np.allclose(data['y'], survey.data['y'])
+    assert np.allclose(data['z'], survey.data['z'] - 2.0)
+    assert np.array_equal(data['elevation'], survey.data['elevation'])
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from volpy import Survey, TiledTriangularMesh, TriangularMesh
+from volpy.tiling import TileGrid
+
+def get_point_cloud(points=5000, seed=0):
+    generator = np.random.default_rng(seed)
+    point_cloud = pd.DataFrame({'x': generator.uniform(0.0, 100.0, points),
+                                'y': generator.uniform(0.0, 60.0, points)})
+    point_cloud['z'] = (np.sin(point_cloud['x']/10.0) +
+                        point_cloud['y']/10.0 + 5.0)
+    point_cloud['elevation'] = point_cloud['z']
+    return point_cloud
+
+def get_triangles(mesh):
+    return set(map(tuple, np.sort(mesh.data, axis=1)))
+
+def test_tile_grid():
+    grid = TileGrid((0.0, 0.0, 10.0, 4.0), 3.0)
+    assert (grid.rows, grid.columns, len(grid)) == (2, 4, 8)
+    tiles = grid.get_tile(np.array([0.0, 10.0, 2.9, 3.0]),
+                          np.array([0.0, 4.0, 3.1, 0.0]))
+    assert list(tiles) == [0, 7, 4, 1]
+    assert grid.get_bounds(5) == (3.0, 3.0, 6.0, 6.0)
+    assert sorted(grid.get_tiles((2.0, 1.0, 4.0, 2.0))) == [0, 1]
+
+@pytest.mark.parametrize('points_per_tile, workers', [
+    (200, 1),
+    (1000, 1),
+    (1000, 2),
+])
+def test_tiled_mesh_matches_single_mesh(points_per_tile, workers):
+    point_cloud = get_point_cloud()
+    mesh = TriangularMesh(point_cloud)
+    tiled = TiledTriangularMesh(point_cloud,
+                                points_per_tile=points_per_tile,
+                                workers=workers)
+    assert len(tiled._grid) > 1
+    # every triangle is kept by exactly one tile
+    assert len(tiled.data) == len(mesh.data)
+    assert get_triangles(tiled) == get_triangles(mesh)
+    assert tiled.get_volume() == pytest.approx(mesh.get_volume())
+    assert tiled.get_cut_volume(5.5) == pytest.approx(
+        mesh.get_cut_volume(5.5))
+    assert tiled.get_fill_volume(5.5) == pytest.approx(
+        mesh.get_fill_volume(5.5))
+    pd.testing.assert_frame_equal(
+        tiled.get_volume_curves(step=0.5, show_progress=False),
+        mesh.get_volume_curves(step=0.5, show_progress=False))
+
+def test_tiled_mesh_elevation():
+    point_cloud = get_point_cloud()
+    mesh = TriangularMesh(point_cloud)
+    tiled = TiledTriangularMesh(point_cloud, points_per_tile=500)
+    generator = np.random.default_rng(1)
+    x = generator.uniform(-5.0, 105.0, 2000)
+    y = generator.uniform(-5.0, 65.0, 2000)
+    np.testing.assert_allclose(tiled.get_elevation(x, y),
+                               mesh.get_elevation(x, y))
+    raster = tiled.rasterize(2.0)
+    np.testing.assert_allclose(raster.elevation,
+                               mesh.rasterize(2.0).elevation)
+
+def test_tiled_mesh_survey():
+    source = '../volpy/sample_data/survey_ibema_faxinal_Cartesian.csv'
+    survey = Survey(source, 'sample')
+    mesh = TriangularMesh(survey.data)
+    tiled = TiledTriangularMesh(survey.data, tile_size=10.0)
+    assert get_triangles(tiled) == get_triangles(mesh)
+    assert tiled.get_volume() == pytest.approx(mesh.get_volume())
+
+def test_tiled_mesh_add_points():
+    point_cloud = get_point_cloud(6000)
+    tiled = TiledTriangularMesh(point_cloud.iloc[:5000], points_per_tile=500)
+    tiled.get_volume()
+    tiled.get_cut_volume(5.5)
+    tiled.add_points(point_cloud.iloc[5000:])
+    mesh = TriangularMesh(point_cloud)
+    assert get_triangles(tiled) == get_triangles(mesh)
+    assert tiled._results['volume'] == pytest.approx(mesh.get_volume())
+    assert tiled.get_cut_volume(5.5) == pytest.approx(
+        mesh.get_cut_volume(5.5))
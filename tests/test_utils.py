@@ -0,0 +1,83 @@
+import logging
+import threading
+import pytest
+import volpy
+from volpy.utils import Progress, get_progress
+
+def test_progress_throttled_callback():
+    reports = []
+    progress = Progress(1000,
+                        sink=lambda done, total: reports.append((done, total)),
+                        min_interval=0.0,
+                        min_percent=10.0)
+    for _ in range(1000):
+        progress.update()
+    assert len(reports) == 10
+    assert reports[-1] == (1000, 1000)
+
+def test_progress_time_throttle():
+    reports = []
+    progress = Progress(1000,
+                        sink=lambda done, total: reports.append((done, total)),
+                        min_interval=3600.0,
+                        min_percent=0.0)
+    for _ in range(1000):
+        progress.update()
+    # the first report and the final one on completion
+    assert reports == [(1, 1000), (1000, 1000)]
+
+def test_progress_threads():
+    reports = []
+    progress = Progress(8000,
+                        sink=lambda done, total: reports.append(done),
+                        min_interval=0.0)
+    def work():
+        for _ in range(1000):
+            progress.update()
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert progress.done == 8000
+    assert reports == sorted(reports)
+    assert reports[-1] == 8000
+
+def test_progress_empty(capsys):
+    reports = []
+    for sink in ['bar', lambda done, total: reports.append(done)]:
+        progress = Progress(0, sink=sink)
+        progress.set(0)
+        progress.update(0)
+    assert reports == [] and capsys.readouterr().out == ''
+
+def test_progress_logger(caplog):
+    logger = logging.getLogger('volpy.test')
+    with caplog.at_level(logging.INFO, logger='volpy.test'):
+        progress = get_progress(logger, 4)
+        progress.set(4)
+    assert 'Progress: 4/4 Complete' in caplog.text
+
+@pytest.mark.parametrize('show_progress, sink', [
+    (True, 'bar'),
+    (False, None),
+    (None, None),
+])
+def test_get_progress(show_progress, sink):
+    assert get_progress(show_progress, 10).sink == sink
+
+def test_get_progress_instance():
+    progress = Progress(10, sink=None)
+    assert get_progress(progress, 10) is progress
+
+def test_mesh_progress_callback(capsys):
+    survey = volpy.load_survey(
+        '../volpy/sample_data/survey_delaunay_Cartesian.csv')
+    mesh = volpy.TriangularMesh(survey.data)
+    reports = []
+    mesh.get_volume_curves(step=1.0,
+                           show_progress=lambda done, total:
+                               reports.append((done, total)))
+    assert reports[-1][0] == reports[-1][1]
+    mesh.get_volume_curves(step=1.0, show_progress=False)
+    assert capsys.readouterr().out == ''
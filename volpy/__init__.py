@@ -1,23 +1,51 @@
-import datetime
-import pandas as pd
-from pkg_resources import resource_filename
-sample = resource_filename(__name__, 'sample_data/survey_ibema_faxinal_Cartesian.csv')
+import importlib
+import os
 
 from .coordinates import (
     CartesianCoordinate,
+    CartesianCoordinateBatch,
     CoordinateSystem,
 )
-from .geometry import (
-    Line2D,
-    Triangle,
-    TriangularMesh,
-    TriangularMesh as terrain_mesh,
-)
+from .raster import Raster
 from .survey import (
     Survey,
     Survey as load_survey,
 )
-from .plots import SurveyPlot as terrain_plots
+
+# Attributes imported on first access, so that `import volpy` does not pull
+# scipy (meshing) or plotly (plotting) into workers that only load surveys.
+_lazy_attributes = {
+    'HypsometricIndex': ('.geometry', 'HypsometricIndex'),
+    'Line2D': ('.geometry', 'Line2D'),
+    'Triangle': ('.geometry', 'Triangle'),
+    'TriangleBatch': ('.geometry', 'TriangleBatch'),
+    'TriangularMesh': ('.geometry', 'TriangularMesh'),
+    'TiledTriangularMesh': ('.tiling', 'TiledTriangularMesh'),
+    'get_difference_volumes': ('.difference', 'get_difference_volumes'),
+    'get_difference_regions': ('.difference', 'get_difference_regions'),
+    'terrain_mesh': ('.geometry', 'TriangularMesh'),
+    'terrain_plots': ('.plots', 'SurveyPlot'),
+}
+
+def _get_sample():
+    """Returns the path to the sample survey shipped with the package."""
+    return os.path.join(os.path.dirname(__file__),
+                        'sample_data',
+                        'survey_ibema_faxinal_Cartesian.csv')
+
+def __getattr__(name):
+    if name == 'sample':
+        return _get_sample()
+    if name in _lazy_attributes:
+        (module, attribute) = _lazy_attributes[name]
+        value = getattr(importlib.import_module(module, __name__), attribute)
+        globals()[name] = value
+        return value
+    raise AttributeError(
+        "module {!r} has no attribute {!r}".format(__name__, name))
+
+def __dir__():
+    return sorted(list(globals()) + list(_lazy_attributes) + ['sample'])
 
 
 def demo():
@@ -26,8 +54,12 @@ def demo():
     displays information about it and related graphs: 3D Scatter, Contour,
     Histogram and 2D Scatter and finally the Volume Curves.
     """
+    import datetime
+    from .geometry import TriangularMesh as terrain_mesh
+    from .plots import SurveyPlot as terrain_plots
+
     print("Loading sample survey data...")
-    survey = load_survey(sample,
+    survey = load_survey(_get_sample(),
         'Ibema Faxinal')
     if survey is not None:
         print('Sample survey data loaded successfully.')
@@ -0,0 +1,158 @@
+# On-disk binary caches that avoid parsing the same sources again.
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+
+CACHE_VERSION = 1
+SURVEY_COLUMNS = ['x', 'y', 'z', 'elevation']
+
+def get_survey_key(source, coordinate_system, content_hash=False):
+    """
+    Returns a string that identifies a parsed survey source. It changes
+    whenever the source path, size, modification time or coordinate system
+    change, so stale cache entries are invalidated automatically.
+
+    :param source: path to the survey source file.
+    :param coordinate_system: the CoordinateSystem the source is parsed with.
+    :param content_hash: (bool) keys on a SHA-256 of the file contents instead
+                         of its modification time when True.
+    """
+    status = os.stat(source)
+    parts = [str(CACHE_VERSION),
+             os.path.abspath(source),
+             str(status.st_size),
+             coordinate_system.name]
+    if content_hash:
+        digest = hashlib.sha256()
+        with open(source, 'rb') as source_file:
+            for block in iter(lambda: source_file.read(1 << 20), b''):
+                digest.update(block)
+        parts.append(digest.hexdigest())
+    else:
+        parts.append(str(status.st_mtime_ns))
+    return hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()
+
+def _get_survey_paths(cache_dir, source):
+    """
+    Returns a tuple (array_path, metadata_path) of the cache entry of a
+    source. There is a single entry per source path, so a new key replaces
+    the previous entry instead of piling up files.
+    """
+    source = os.path.abspath(source)
+    stem = os.path.splitext(os.path.basename(source))[0]
+    name = '{}-{}'.format(
+        stem, hashlib.sha256(source.encode('utf-8')).hexdigest()[:16])
+    return (os.path.join(cache_dir, name + '.npy'),
+            os.path.join(cache_dir, name + '.json'))
+
+def load_survey(cache_dir, source, key):
+    """
+    Returns a tuple (data, metadata) out of the cache entry of source, where
+    data is a pandas DataFrame backed by a copy-on-write memory map of the
+    cached x, y, z, elevation arrays. Returns None when there is no entry for
+    the given key.
+
+    :param cache_dir: directory that holds the cache entries.
+    :param source: path to the survey source file.
+    :param key: the key returned by get_survey_key.
+    """
+    (array_path, metadata_path) = _get_survey_paths(cache_dir, source)
+    try:
+        with open(metadata_path, 'r') as metadata_file:
+            metadata = json.load(metadata_file)
+        if metadata.get('key') != key:
+            return None
+        points = np.load(array_path, mmap_mode='c')
+    except (OSError, ValueError):
+        return None
+    # Stored column-major, so each column is a contiguous view of the map.
+    data = pd.DataFrame(points, columns=SURVEY_COLUMNS, copy=False)
+    return (data, metadata)
+
+def save_survey(cache_dir, source, key, data, **metadata):
+    """
+    Stores the x, y, z, elevation columns of data as a memory-mappable .npy
+    array along with a .json file containing the key and metadata.
+
+    :param cache_dir: directory that holds the cache entries.
+    :param source: path to the survey source file.
+    :param key: the key returned by get_survey_key.
+    :param data: pandas DataFrame containing x, y, z, elevation columns.
+    :param metadata: JSON serializable values stored with the entry.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    (array_path, metadata_path) = _get_survey_paths(cache_dir, source)
+    points = np.asfortranarray(data[SURVEY_COLUMNS].to_numpy(np.float64))
+    metadata['key'] = key
+    # Write to temporary files first so readers never see partial entries.
+    with open(array_path + '.tmp', 'wb') as array_file:
+        np.save(array_file, points)
+    with open(metadata_path + '.tmp', 'w') as metadata_file:
+        json.dump(metadata, metadata_file)
+    os.replace(array_path + '.tmp', array_path)
+    os.replace(metadata_path + '.tmp', metadata_path)
+
+def get_point_cloud_fingerprint(point_cloud):
+    """
+    Returns a SHA-256 of the x, y, z values of a point cloud. It ties a cached
+    mesh to the point cloud it was built from.
+
+    :param point_cloud: pandas DataFrame containing x, y, z columns.
+    """
+    digest = hashlib.sha256()
+    for column in ['x', 'y', 'z']:
+        values = np.ascontiguousarray(point_cloud[column].to_numpy(np.float64))
+        digest.update(values.tobytes())
+    return digest.hexdigest()
+
+def save_mesh(path, point_cloud, simplices, areas):
+    """
+    Stores a triangular mesh in the directory path as memory-mappable .npy
+    arrays (points, simplices, areas) along with a mesh.json file containing
+    the fingerprint of its point cloud.
+
+    :param path: directory of the cached mesh. Created when missing.
+    :param point_cloud: pandas DataFrame containing x, y, z, elevation.
+    :param simplices: numpy array with Nx3 point indices.
+    :param areas: numpy array with the projected area of each triangle.
+    """
+    os.makedirs(path, exist_ok=True)
+    points = point_cloud[SURVEY_COLUMNS].to_numpy(np.float64)
+    metadata = {'version': CACHE_VERSION,
+                'fingerprint': get_point_cloud_fingerprint(point_cloud),
+                'triangles': len(simplices)}
+    # The arrays may be memory maps of the files being replaced (a loaded
+    # mesh saved to its own path), so every file is written to a temporary
+    # one first and moved into place, mesh.json last.
+    arrays = [('points.npy', np.asfortranarray(points)),
+              ('simplices.npy', simplices),
+              ('areas.npy', areas)]
+    for (name, array) in arrays:
+        with open(os.path.join(path, name + '.tmp'), 'wb') as array_file:
+            np.save(array_file, array)
+    with open(os.path.join(path, 'mesh.json.tmp'), 'w') as metadata_file:
+        json.dump(metadata, metadata_file)
+    for name in [name for (name, _) in arrays] + ['mesh.json']:
+        os.replace(os.path.join(path, name + '.tmp'),
+                   os.path.join(path, name))
+
+def load_mesh(path):
+    """
+    Returns a tuple (point_cloud, simplices, areas, metadata) out of a mesh
+    stored by save_mesh. simplices and areas are read-only memory maps, so
+    processes opening the same mesh share a single copy. The point cloud is
+    backed by a copy-on-write memory map.
+
+    :param path: directory of the cached mesh.
+    """
+    with open(os.path.join(path, 'mesh.json'), 'r') as metadata_file:
+        metadata = json.load(metadata_file)
+    if metadata.get('version') != CACHE_VERSION:
+        raise ValueError("Unsupported mesh cache version.")
+    points = np.load(os.path.join(path, 'points.npy'), mmap_mode='c')
+    point_cloud = pd.DataFrame(points, columns=SURVEY_COLUMNS, copy=False)
+    simplices = np.load(os.path.join(path, 'simplices.npy'), mmap_mode='r')
+    areas = np.load(os.path.join(path, 'areas.npy'), mmap_mode='r')
+    return (point_cloud, simplices, areas, metadata)
@@ -9,12 +9,17 @@ class CoordinateSystem(Enum):
     CARTESIAN = 2
 
 class GeographicCoordinate():
+    __slots__ = ('latitude', 'longitude', 'elevation')
+
     def __init__(self, latitude, longitude, elevation):
         self.latitude = latitude
         self.longitude = longitude
         self.elevation = elevation # above sea level
 
 class UtmCoordinate():
+    __slots__ = ('northing', 'easting', 'zone_number', 'zone_letter',
+                 'elevation')
+
     def __init__(self, northing, easting, zone_number, zone_letter, elevation):
         self.northing = northing
         self.easting = easting
@@ -30,10 +35,55 @@ class UtmCoordinate():
             longitude)
         return cls(northing, easting, zone_number, zone_letter, elevation)
 
+    @staticmethod
+    def get_zone(latitudes, longitudes):
+        """
+        Returns a tuple (zone_number, zone_letter) with the UTM zone of the
+        center of a collection of geographic coordinates. It is used to project
+        a whole survey into a single zone.
+        """
+        latitude = (np.min(latitudes) + np.max(latitudes))/2.0
+        longitude = (np.min(longitudes) + np.max(longitudes))/2.0
+        zone_number = utm.latlon_to_zone_number(latitude, longitude)
+        zone_letter = utm.latitude_to_zone_letter(latitude)
+        return (zone_number, zone_letter)
+
+    @classmethod
+    def create_from_geographic_array(cls,
+                                     latitudes,
+                                     longitudes,
+                                     elevations,
+                                     zone_number=None,
+                                     zone_letter=None):
+        """
+        Creates a single instance in UTM whose northing, easting and elevation
+        attributes are numpy arrays, converting all geographic coordinates at
+        once. Every point is projected into the same zone so points near a
+        zone boundary are not silently mixed.
+
+        Arguments:
+        latitudes, longitudes, elevations: array-like geographic coordinates.
+        zone_number, zone_letter: the UTM zone to force. Default: the zone
+                                  of the center of the coordinates.
+        """
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        elevations = np.asarray(elevations, dtype=np.float64)
+        if zone_number is None or zone_letter is None:
+            (zone_number, zone_letter) = cls.get_zone(latitudes, longitudes)
+        (northing, easting, zone_number, zone_letter) = utm.from_latlon(
+            latitudes,
+            longitudes,
+            force_zone_number=zone_number,
+            force_zone_letter=zone_letter)
+        return cls(northing, easting, zone_number, zone_letter, elevations)
+
 class CartesianCoordinate():
     """
     Classical cartesian coordinate system with x, y, z axes.
     """
+    __slots__ = ('x', 'y', 'z')
+
     def __init__(self, x: np.float64, y: np.float64, z: np.float64):
         self.x = x
         self.y = y
@@ -47,9 +97,9 @@ class CartesianCoordinate():
         Returns the difference between 2 points in a cartesian plane.
         It is used to create a vector out of 2 points in 3D space.
         """
-        minuend = np.array([self.x, self.y, self.z])
-        subtrahend = np.array([other.x, other.y, other.z])
-        return minuend - subtrahend
+        return np.array([self.x - other.x,
+                         self.y - other.y,
+                         self.z - other.z])
 
     def __lt__(self, other):
         """Comparison override used to sort points in function of their x
@@ -61,4 +111,59 @@ class CartesianCoordinate():
 
     def __eq__(self, other):
         return self.x == other.x and self.y == other.y and self.z == other.z
-        
+
+class CartesianCoordinateBatch():
+    """
+    N cartesian coordinates held as 3 contiguous numpy arrays (x, y, z)
+    instead of N CartesianCoordinate objects.
+    """
+    __slots__ = ('x', 'y', 'z')
+
+    def __init__(self, x, y, z):
+        self.x = np.ascontiguousarray(x, dtype=np.float64)
+        self.y = np.ascontiguousarray(y, dtype=np.float64)
+        self.z = np.ascontiguousarray(z, dtype=np.float64)
+        if not self.x.shape == self.y.shape == self.z.shape:
+            raise ValueError('x, y and z must have the same shape.')
+
+    @classmethod
+    def from_points(cls, points):
+        """Creates a batch out of an iterable of CartesianCoordinate."""
+        points = list(points)
+        return cls([point.x for point in points],
+                   [point.y for point in points],
+                   [point.z for point in points])
+
+    @classmethod
+    def from_dataframe(cls, data):
+        """Creates a batch out of a DataFrame with x, y and z columns."""
+        return cls(data['x'].to_numpy(),
+                   data['y'].to_numpy(),
+                   data['z'].to_numpy())
+
+    def __len__(self):
+        return len(self.x)
+
+    def __getitem__(self, index):
+        """
+        Returns a CartesianCoordinate for an integer index and a new batch
+        for a slice, boolean mask or index array.
+        """
+        if np.ndim(index) == 0 and not isinstance(index, slice):
+            return CartesianCoordinate(self.x[index],
+                                       self.y[index],
+                                       self.z[index])
+        return CartesianCoordinateBatch(self.x[index],
+                                        self.y[index],
+                                        self.z[index])
+
+    def __sub__(self, other):
+        """
+        Returns an Nx3 numpy array with the vectors from the points of other
+        (a batch or a single CartesianCoordinate) to the points of this batch.
+        """
+        vectors = np.empty(self.x.shape + (3,))
+        np.subtract(self.x, other.x, out=vectors[..., 0])
+        np.subtract(self.y, other.y, out=vectors[..., 1])
+        np.subtract(self.z, other.z, out=vectors[..., 2])
+        return vectors
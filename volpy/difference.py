@@ -0,0 +1,277 @@
+# Cut and fill volumes between two surfaces, e.g. the surveys of a site
+# before and after excavation or stockpile depletion.
+import numpy as np
+import pandas as pd
+
+from .coordinates import CartesianCoordinateBatch
+from .geometry import TriangleBatch, TriangularMesh, _get_clipped_heights
+from .instrumentation import stage
+from .survey import Survey
+
+_PAIRS_PER_CHUNK = 2**18 # triangle pairs clipped at once
+
+def _get_mesh(surface, offset):
+    """
+    Returns the TriangularMesh of surface, a TriangularMesh or a Survey whose
+    data is expressed relative to offset (its own offset when None).
+    """
+    if isinstance(surface, TriangularMesh):
+        return surface
+    if isinstance(surface, Survey):
+        return TriangularMesh(surface.get_data(offset))
+    raise TypeError("Expected a Survey or a TriangularMesh.")
+
+def _get_triangles(mesh):
+    """
+    Returns a tuple (x, y, planes) with the Nx3 vertex coordinates of the
+    triangles of mesh and an Nx3 array with the coefficients (a, b, c) of
+    their planes z = a*x + b*y + c.
+    """
+    (data, _) = mesh._get_topology(mesh.point_cloud)
+    batch = TriangleBatch.from_points(
+        CartesianCoordinateBatch.from_dataframe(mesh.point_cloud), data)
+    return (batch.x, batch.y, np.column_stack(batch.get_plane_coefficients()))
+
+def _get_cells(x, y, bounds, cell_size, columns):
+    """
+    Returns a tuple of numpy arrays (triangles, cells) with one entry for
+    every cell of the grid with the given columns, origin at the lower left
+    corner of bounds and cell_size, that the bounding box of a triangle
+    overlaps. Triangles whose bounding box misses bounds are left out.
+    """
+    (x_min, y_min, x_max, y_max) = bounds
+    rows = int(np.floor((y_max - y_min)/cell_size)) + 1
+    misses = ((x.max(axis=1) < x_min) | (x.min(axis=1) > x_max) |
+              (y.max(axis=1) < y_min) | (y.min(axis=1) > y_max))
+    def get_range(values, lower, count):
+        first = np.floor((values.min(axis=1) - lower)/cell_size)
+        last = np.floor((values.max(axis=1) - lower)/cell_size)
+        return (np.clip(first, 0, count - 1).astype(np.int64),
+                np.clip(last, 0, count - 1).astype(np.int64))
+    (first_column, last_column) = get_range(x, x_min, columns)
+    (first_row, last_row) = get_range(y, y_min, rows)
+    width = last_column - first_column + 1
+    counts = np.where(misses, 0, width*(last_row - first_row + 1))
+
+    triangles = np.repeat(np.arange(len(x)), counts)
+    steps = np.arange(len(triangles)) - np.repeat(np.cumsum(counts) - counts,
+                                                  counts)
+    cells = ((first_row[triangles] + steps // width[triangles])*columns +
+             first_column[triangles] + steps % width[triangles])
+    return (triangles, cells)
+
+def _get_candidate_pairs(x_a, y_a, x_b, y_b):
+    """
+    Returns a tuple of index arrays (a, b) with every pair of triangles of
+    the two meshes whose bounding boxes overlap, a superset of the pairs of
+    overlapping triangles. Triangles are binned in the cells of a grid over
+    the overlap of the meshes that their bounding box touches, and each pair
+    is only taken from the cell holding the lower left corner of the
+    intersection of their bounding boxes.
+    """
+    bounds = (max(x_a.min(), x_b.min()), max(y_a.min(), y_b.min()),
+              min(x_a.max(), x_b.max()), min(y_a.max(), y_b.max()))
+    if bounds[0] > bounds[2] or bounds[1] > bounds[3]:
+        return (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+    # cells about as large as the typical triangle of the coarser mesh
+    cell_size = max(np.median(x_a.max(axis=1) - x_a.min(axis=1)),
+                    np.median(y_a.max(axis=1) - y_a.min(axis=1)),
+                    np.median(x_b.max(axis=1) - x_b.min(axis=1)),
+                    np.median(y_b.max(axis=1) - y_b.min(axis=1)))
+    extent = max(bounds[2] - bounds[0], bounds[3] - bounds[1])
+    cell_size = max(cell_size, extent*1e-6, np.finfo(np.float64).tiny)
+    columns = int(np.floor((bounds[2] - bounds[0])/cell_size)) + 1
+    rows = int(np.floor((bounds[3] - bounds[1])/cell_size)) + 1
+
+    (triangles_a, cells_a) = _get_cells(x_a, y_a, bounds, cell_size, columns)
+    (triangles_b, cells_b) = _get_cells(x_b, y_b, bounds, cell_size, columns)
+    order = np.argsort(cells_a, kind='stable')
+    (triangles_a, cells_a) = (triangles_a[order], cells_a[order])
+    first = np.searchsorted(cells_a, cells_b, side='left')
+    counts = np.searchsorted(cells_a, cells_b, side='right') - first
+    steps = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts,
+                                                counts)
+    a = triangles_a[np.repeat(first, counts) + steps]
+    b = np.repeat(triangles_b, counts)
+    cells = np.repeat(cells_b, counts)
+
+    lower_x = np.maximum(x_a.min(axis=1)[a], x_b.min(axis=1)[b])
+    lower_y = np.maximum(y_a.min(axis=1)[a], y_b.min(axis=1)[b])
+    overlap = ((lower_x <= np.minimum(x_a.max(axis=1)[a],
+                                      x_b.max(axis=1)[b])) &
+               (lower_y <= np.minimum(y_a.max(axis=1)[a],
+                                      y_b.max(axis=1)[b])))
+    column = np.clip(np.floor((lower_x - bounds[0])/cell_size), 0,
+                     columns - 1)
+    row = np.clip(np.floor((lower_y - bounds[1])/cell_size), 0, rows - 1)
+    keep = overlap & (row*columns + column == cells)
+    return (a[keep], b[keep])
+
+def _clip(x, y, x_b, y_b):
+    """
+    Returns a tuple (indexes, x, y, count) with the convex polygons of the
+    triangles x, y (Mx3 arrays) clipped by the triangles x_b, y_b (Mx3
+    arrays), one edge at a time: the rows of the input whose polygon is not
+    empty and their vertices in arrays of K columns, the first count of each
+    row in use.
+    """
+    orientation = np.sign((x_b[:, 1] - x_b[:, 0])*(y_b[:, 2] - y_b[:, 0]) -
+                          (x_b[:, 2] - x_b[:, 0])*(y_b[:, 1] - y_b[:, 0]))
+    indexes = np.arange(len(x))
+    count = np.full(len(x), 3)
+    for edge in range(3):
+        rows = np.arange(len(x))[:, np.newaxis]
+        vertices = np.arange(x.shape[1])[np.newaxis, :]
+        (start_x, start_y) = (x_b[:, [edge]], y_b[:, [edge]])
+        (end_x, end_y) = (x_b[:, [(edge + 1) % 3]], y_b[:, [(edge + 1) % 3]])
+        side = orientation[:, np.newaxis]*(
+            (end_x - start_x)*(y - start_y) - (end_y - start_y)*(x - start_x))
+        used = vertices < count[:, np.newaxis]
+        following = np.where(vertices + 1 < count[:, np.newaxis],
+                             vertices + 1, 0)
+        (next_x, next_y) = (x[rows, following], y[rows, following])
+        next_side = side[rows, following]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = side/(side - next_side)
+            crossing_x = x + t*(next_x - x)
+            crossing_y = y + t*(next_y - y)
+        # Every vertex emits itself when inside, followed by the crossing of
+        # its edge to the next vertex when the edge leaves or enters.
+        keep = np.stack((used & (side >= 0.0),
+                         used & (side*next_side < 0.0)),
+                        axis=2).reshape(len(x), 2*x.shape[1])
+        # a convex polygon clipped by a half-plane gains one vertex at most
+        capacity = x.shape[1] + 1
+        position = np.cumsum(keep, axis=1) - 1
+        keep &= position < capacity
+        (kept_rows, _) = np.nonzero(keep)
+        kept_positions = position[keep]
+        candidates_x = np.stack((x, crossing_x), axis=2).reshape(len(x), 2*x.shape[1])
+        candidates_y = np.stack((y, crossing_y), axis=2).reshape(len(x), 2*x.shape[1])
+        x = np.zeros((len(x), capacity))
+        y = np.zeros((len(y), capacity))
+        x[kept_rows, kept_positions] = candidates_x[keep]
+        y[kept_rows, kept_positions] = candidates_y[keep]
+        count = keep.sum(axis=1)
+        # polygons left with less than 3 vertices have no area
+        alive = count >= 3
+        (indexes, x, y, count) = (indexes[alive], x[alive], y[alive],
+                                  count[alive])
+        (x_b, y_b, orientation) = (x_b[alive], y_b[alive], orientation[alive])
+    return (indexes, x, y, count)
+
+def _get_pieces(x_a, y_a, planes_a, x_b, y_b, planes_b, a, b):
+    """
+    Returns a tuple (x, y, heights) of Nx3 arrays with the triangles the
+    overlap of every pair of triangles (a[i], b[i]) is split into and the
+    height of the second surface above the first at their vertices. Both
+    surfaces are planar over each piece, so their difference is as well.
+    """
+    (indexes, x, y, count) = _clip(x_a[a], y_a[a], x_b[b], y_b[b])
+    (a, b) = (a[indexes], b[indexes])
+
+    # fan triangulation of every polygon from its first vertex
+    (pair, fan) = np.nonzero(np.arange(x.shape[1] - 2)[np.newaxis, :] + 2 <
+                             count[:, np.newaxis])
+    corners = np.column_stack((np.zeros_like(fan), fan + 1, fan + 2))
+    piece_x = x[pair[:, np.newaxis], corners]
+    piece_y = y[pair[:, np.newaxis], corners]
+    difference = planes_b[b[pair]] - planes_a[a[pair]]
+    heights = (difference[:, [0]]*piece_x + difference[:, [1]]*piece_y +
+               difference[:, [2]])
+    return (piece_x, piece_y, heights)
+
+def _get_difference(before, after, get_labels):
+    """
+    Returns a pandas DataFrame indexed by region with the area, cut and fill
+    volumes between the meshes before and after over every region. The
+    overlap of every pair of triangles is integrated exactly.
+
+    :param get_labels: callable receiving the x, y arrays of the centroids
+                       of the pieces and returning a dict with the columns
+                       (name: array) identifying their regions.
+    """
+    (x_a, y_a, planes_a) = _get_triangles(before)
+    (x_b, y_b, planes_b) = _get_triangles(after)
+    with stage('difference.pairs') as pairs:
+        (a, b) = _get_candidate_pairs(x_a, y_a, x_b, y_b)
+        pairs.count(pairs=len(a))
+
+    totals = []
+    with stage('difference.volumes') as volumes:
+        for start in range(0, max(len(a), 1), _PAIRS_PER_CHUNK):
+            chunk = slice(start, start + _PAIRS_PER_CHUNK)
+            (x, y, heights) = _get_pieces(x_a, y_a, planes_a,
+                                          x_b, y_b, planes_b,
+                                          a[chunk], b[chunk])
+            areas = TriangleBatch(x, y, heights).get_projected_areas()
+            (above, mean) = _get_clipped_heights(np.sort(heights, axis=1),
+                                                 np.zeros(1))
+            labels = get_labels(x.mean(axis=1), y.mean(axis=1))
+            # after above before is fill, before above after is cut
+            pieces = pd.DataFrame(dict(labels,
+                                       area=areas,
+                                       cut=(above[0] - mean[0])*areas,
+                                       fill=above[0]*areas))
+            totals.append(pieces.groupby(list(labels)).sum())
+            volumes.count(pieces=len(x))
+    totals = pd.concat(totals)
+    return totals.groupby(level=list(range(totals.index.nlevels))).sum()
+
+def _get_surfaces(before, after):
+    """
+    Returns the meshes of before and after, with a Survey after expressed
+    relative to the offset of a Survey before.
+    """
+    offset = before.offset if isinstance(before, Survey) else None
+    return (_get_mesh(before, None), _get_mesh(after, offset))
+
+def get_difference_volumes(before, after):
+    """
+    Returns a tuple (cut, fill, net) with the volumes between the surfaces
+    before and after over their common footprint: cut where the surface
+    before lies above the surface after (material removed), fill where it
+    lies below (material added) and net = fill - cut. Every triangle of
+    one mesh is clipped by the triangles of the other one it overlaps,
+    so the result is exact and no volume curve is computed.
+
+    :param before: (Survey or TriangularMesh) the surface of reference.
+    :param after: (Survey or TriangularMesh) the surface compared with it.
+                  A Survey after is expressed with the offset of a Survey
+                  before. Meshes must share the same x, y, z origin.
+    """
+    (before, after) = _get_surfaces(before, after)
+    totals = _get_difference(
+        before, after,
+        lambda x, y: {'region': np.zeros(len(x), dtype=np.int64)})
+    (cut, fill) = (float(totals['cut'].sum()), float(totals['fill'].sum()))
+    return (cut, fill, fill - cut)
+
+def get_difference_regions(before, after, regions):
+    """
+    Returns a pandas DataFrame with the breakdown of get_difference_volumes
+    per region, with the columns area (of the common footprint in the
+    region), cut, fill and net. Every piece of the clipped triangles
+    belongs to the region of its centroid.
+
+    :param before: (Survey or TriangularMesh) the surface of reference.
+    :param after: (Survey or TriangularMesh) the surface compared with it.
+    :param regions: (float) side of square regions, whose lower left corner
+                    is given by the x_min, y_min columns. Or a callable
+                    receiving x, y arrays and returning an array with the
+                    region label of each point, given by the region column.
+    """
+    (before, after) = _get_surfaces(before, after)
+    if callable(regions):
+        def get_labels(x, y):
+            return {'region': np.asarray(regions(x, y))}
+    else:
+        size = float(regions)
+        if size <= 0.0:
+            raise ValueError("The region size must be positive.")
+        def get_labels(x, y):
+            return {'x_min': np.floor(x/size)*size,
+                    'y_min': np.floor(y/size)*size}
+    breakdown = _get_difference(before, after, get_labels)
+    breakdown['net'] = breakdown['fill'] - breakdown['cut']
+    return breakdown.reset_index()
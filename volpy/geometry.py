@@ -1,18 +1,23 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
 import numpy as np
-from sympy import symbols
-from sympy import integrate
-from scipy.spatial import Delaunay
+from scipy.optimize import brentq
+from scipy.spatial import cKDTree, Delaunay
 import pandas as pd
-import plotly
-import plotly.offline as po
-import plotly.graph_objs as go
-from plotly import tools
 
+from . import cache
 from .coordinates import CartesianCoordinate
-from .utils import print_progress
+from .coordinates import CartesianCoordinateBatch
+from .instrumentation import stage
+from .raster import Raster
+from .utils import attach_array
+from .utils import get_progress
+from .utils import share_array
 
 class Line2D():
     """A 2-Dimensional line"""
+    __slots__ = ('point_A', 'point_B')
+
     def __init__(self,
                  point_A: CartesianCoordinate,
                  point_B: CartesianCoordinate):
@@ -35,11 +40,38 @@ class Line2D():
             slope = (self.point_B.y - self.point_A.y) /\
                     (self.point_B.x - self.point_A.x)
             linear_constant = -slope*self.point_A.x + self.point_A.y
+            from sympy import symbols
             x = symbols('x')
             return slope*x + linear_constant
 
+    def get_line_coefficients(self):
+        """Returns a tuple (slope, linear_constant) of the line y = slope*x +
+        linear_constant that connects point_A to point_B, or None when the
+        line is parallel to the y axis.
+        """
+        if self.point_B.x - self.point_A.x == 0: # line parallel to the y axis
+            return None
+        slope = (self.point_B.y - self.point_A.y) /\
+                (self.point_B.x - self.point_A.x)
+        return (slope, self.point_A.y - slope*self.point_A.x)
+
+    def get_line_function(self):
+        """Returns a vectorized callable f(x), which accepts scalars or numpy
+        arrays, for the line that connects point_A to point_B, or None when
+        the line is parallel to the y axis.
+        """
+        coefficients = self.get_line_coefficients()
+        if coefficients is None:
+            return None
+        (slope, linear_constant) = coefficients
+        def line(x):
+            return slope*np.asarray(x, dtype=np.float64) + linear_constant
+        return line
+
 class Triangle():
     """A triangle in a 3D Cartesian Coordinates System"""
+    __slots__ = ('point_A', 'point_B', 'point_C')
+
     def __init__(self,
                  point_A: CartesianCoordinate,
                  point_B: CartesianCoordinate,
@@ -63,14 +95,47 @@ class Triangle():
         xo = self.point_A.x
         yo = self.point_A.y
         zo = self.point_A.z
+        from sympy import symbols
         x, y = symbols('x y') # z = f(x, y)
         return ((-a*(x-xo)-b*(y-yo))/c)+zo
 
+    def get_plane_coefficients(self):
+        """
+        Returns a tuple (a, b, c) with the coefficients of the plane that
+        contains points A, B and C: z = a*x + b*y + c, or None when the plane
+        is perpendicular to the XY plane.
+        """
+        normal_vector = np.cross(self.point_B - self.point_A,
+                                 self.point_C - self.point_B)
+        if normal_vector[2] == 0:
+            return None
+        a = -normal_vector[0]/normal_vector[2]
+        b = -normal_vector[1]/normal_vector[2]
+        c = self.point_A.z - a*self.point_A.x - b*self.point_A.y
+        return (a, b, c)
+
+    def get_plane_function(self):
+        """
+        Returns a vectorized callable f(x, y), which accepts scalars or numpy
+        arrays, evaluating z on the plane that contains points A, B and C, or
+        None when the plane is perpendicular to the XY plane.
+        """
+        coefficients = self.get_plane_coefficients()
+        if coefficients is None:
+            return None
+        (a, b, c) = coefficients
+        def plane(x, y):
+            return (a*np.asarray(x, dtype=np.float64) +
+                    b*np.asarray(y, dtype=np.float64) + c)
+        return plane
+
     def get_volume(self):
         """
         Returns the volume from the polyhedron generated by triangle ABC and
         the XY plane
         """
+        from sympy import integrate
+        from sympy import symbols
         plane = self.get_plane_equation()
         # Define how to compute a double integral
         def compute_double_integral(outer_boundary_from,
@@ -108,8 +173,529 @@ class Triangle():
         total_volume = abs(volume1) + abs(volume2)
         return total_volume
 
+class TriangleBatch():
+    """
+    N triangles in a 3D Cartesian Coordinates System held as contiguous Nx3
+    arrays x, y and z, whose columns are the vertices A, B and C. It offers
+    the computations of Triangle for all triangles at once.
+    """
+    __slots__ = ('x', 'y', 'z')
+
+    def __init__(self, x, y, z):
+        """Constructor
+
+        Arguments:
+        x, y, z: Nx3 array-like coordinates of the vertices A, B and C.
+        """
+        self.x = np.ascontiguousarray(x, dtype=np.float64).reshape(-1, 3)
+        self.y = np.ascontiguousarray(y, dtype=np.float64).reshape(-1, 3)
+        self.z = np.ascontiguousarray(z, dtype=np.float64).reshape(-1, 3)
+        if not self.x.shape == self.y.shape == self.z.shape:
+            raise ValueError('x, y and z must have the same shape.')
+
+    @classmethod
+    def from_points(cls, points: CartesianCoordinateBatch, simplices):
+        """
+        Creates a batch out of a CartesianCoordinateBatch and an Nx3 array of
+        point indices, one row per triangle (e.g. TriangularMesh.data).
+        """
+        simplices = np.asarray(simplices)
+        return cls(points.x[simplices], points.y[simplices],
+                   points.z[simplices])
+
+    @classmethod
+    def from_triangles(cls, triangles):
+        """Creates a batch out of an iterable of Triangle."""
+        vertices = np.array([[(point.x, point.y, point.z)
+                              for point in (triangle.point_A,
+                                            triangle.point_B,
+                                            triangle.point_C)]
+                             for triangle in triangles],
+                            dtype=np.float64).reshape(-1, 3, 3)
+        return cls(vertices[:, :, 0], vertices[:, :, 1], vertices[:, :, 2])
+
+    def __len__(self):
+        return len(self.x)
+
+    def __getitem__(self, index):
+        """
+        Returns a Triangle for an integer index and a new batch for a slice,
+        boolean mask or index array.
+        """
+        if np.ndim(index) == 0 and not isinstance(index, slice):
+            return Triangle(*[CartesianCoordinate(self.x[index, vertex],
+                                                  self.y[index, vertex],
+                                                  self.z[index, vertex])
+                              for vertex in range(3)])
+        return TriangleBatch(self.x[index], self.y[index], self.z[index])
+
+    def get_normal_vectors(self):
+        """
+        Returns an Nx3 array with the normal vector AB x BC of each triangle,
+        computed in one batched cross product.
+        """
+        vertices = np.stack((self.x, self.y, self.z), axis=-1)
+        vectors = vertices[:, 1:] - vertices[:, :2] # AB and BC
+        return np.cross(vectors[:, 0], vectors[:, 1])
+
+    def get_plane_coefficients(self):
+        """
+        Returns a tuple of arrays (a, b, c) with the coefficients of the plane
+        that contains each triangle: z = a*x + b*y + c. Coefficients of
+        triangles perpendicular to the XY plane are not finite.
+        """
+        normal = self.get_normal_vectors()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            a = -normal[:, 0]/normal[:, 2]
+            b = -normal[:, 1]/normal[:, 2]
+        c = self.z[:, 0] - a*self.x[:, 0] - b*self.y[:, 0]
+        return (a, b, c)
+
+    def get_projected_areas(self):
+        """Returns the area of each triangle projected onto the XY plane."""
+        return _get_projected_areas(self.x, self.y)
+
+    def get_volume(self):
+        """
+        Returns an array with the volume from the polyhedron generated by each
+        triangle and the XY plane: its projected area times the mean height
+        of its vertices.
+        """
+        return _get_prism_volumes(self.get_projected_areas(), self.z)
+
+def _get_projected_areas(x, y):
+    """
+    Returns the area projected onto the XY plane of the triangles whose
+    vertices coordinates are the Nx3 arrays x and y.
+    """
+    x_a, x_b, x_c = x[:, 0], x[:, 1], x[:, 2]
+    y_a, y_b, y_c = y[:, 0], y[:, 1], y[:, 2]
+    return 0.5*np.abs((x_b-x_a)*(y_c-y_a) - (x_c-x_a)*(y_b-y_a))
+
+def _get_prism_volumes(areas, z):
+    """
+    Returns the volume of the prisms of the given projected areas whose
+    vertices heights are the Nx3 array z.
+    """
+    return areas*z.sum(axis=1)/3.0
+
+def get_projected_areas(x, y, simplices):
+    """
+    Returns the area of each triangle projected onto the XY plane.
+
+    :param x: (numpy array) x coordinate of every point.
+    :param y: (numpy array) y coordinate of every point.
+    :param simplices: (numpy array) Nx3 point indices, one row per triangle.
+    """
+    return _get_projected_areas(x[simplices], y[simplices])
+
+def get_prism_volumes(x, y, z, simplices):
+    """
+    Returns the volume of the polyhedron generated by each triangle and the
+    XY plane. A triangular prism with a planar top has a volume equal to its
+    projected area times the mean height of its 3 vertices, which is the
+    closed form of the double integrals applied by Triangle.get_volume.
+
+    :param x: (numpy array) x coordinate of every point.
+    :param y: (numpy array) y coordinate of every point.
+    :param z: (numpy array) z coordinate of every point.
+    :param simplices: (numpy array) Nx3 point indices, one row per triangle.
+    """
+    return _get_prism_volumes(get_projected_areas(x, y, simplices),
+                              z[simplices])
+
+_INDEX_THIN_PIECE = 1e-8 # of the squared range of elevations of the mesh
+_INDEX_MAX_CHANGES = 0.25 # of the triangles of an index updated in place
+_INDEX_MAX_UPDATES = 32 # small indexes held by an index updated in place
+_INDEX_ARRAYS = ('breakpoints', 'coefficients', 'windows')
+_INDEX_SCALARS = ('center', 'volume', 'area', 'width')
+
+def _get_circumcircles(x, y):
+    """
+    Returns a tuple (center_x, center_y, radius) of the circumcircles of the
+    triangles whose vertices coordinates are the Nx3 arrays x and y.
+    """
+    (bx, by) = (x[:, 1] - x[:, 0], y[:, 1] - y[:, 0])
+    (cx, cy) = (x[:, 2] - x[:, 0], y[:, 2] - y[:, 0])
+    d = 2.0*(bx*cy - by*cx)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ux = (cy*(bx**2 + by**2) - by*(cx**2 + cy**2))/d
+        uy = (bx*(cx**2 + cy**2) - cx*(bx**2 + by**2))/d
+    radius = np.hypot(ux, uy)
+    return (x[:, 0] + ux, y[:, 0] + uy, radius)
+
+def _get_spatial_order(points):
+    """
+    Returns the indexes that sort an Nx2 array of points along a serpentine
+    path over a grid of cells covering them, so that consecutive points are
+    close to each other.
+    """
+    finite = np.isfinite(points).all(axis=1)
+    if not finite.any():
+        return np.arange(len(points))
+    cells = max(1, int(np.sqrt(len(points))/2))
+    lower = points[finite].min(axis=0)
+    span = points[finite].max(axis=0) - lower
+    span[span == 0] = 1.0
+    scaled = np.where(finite[:, np.newaxis], (points - lower)/span, 0.0)
+    cell = np.minimum((scaled*cells).astype(np.int64), cells - 1)
+    column = np.where(cell[:, 1] % 2 == 1, cells - 1 - cell[:, 0], cell[:, 0])
+    return np.argsort(cell[:, 1]*cells + column, kind='stable')
+
+def _interpolate(delaunay, z, points):
+    """
+    Returns a tuple (inside, values) where inside tells which of the Nx2
+    points lie in the triangulation and values holds their z, interpolated
+    with the barycentric transforms of the scipy Delaunay object.
+
+    :param z: (numpy array) z coordinate of every point of the triangulation.
+    """
+    simplex = delaunay.find_simplex(points)
+    inside = simplex >= 0
+    simplex = simplex[inside]
+    transform = delaunay.transform[simplex]
+    barycentric = np.einsum('ijk,ik->ij',
+                            transform[:, :2],
+                            points[inside] - transform[:, 2])
+    weights = np.column_stack((barycentric, 1.0 - barycentric.sum(axis=1)))
+    vertices = z[delaunay.simplices[simplex]]
+    return (inside, np.einsum('ij,ij->i', weights, vertices))
+
+def _get_clipped_heights(z_sorted, levels):
+    """
+    Returns a tuple of (levels x triangles) numpy arrays (above, mean): the
+    mean height above each level of the part of each triangle above it, and
+    the mean height of the whole triangle, both relative to the area of the
+    whole triangle. Their difference is the mean depth of the part below.
+
+    :param z_sorted: (numpy array) Nx3 vertex heights, one row per triangle,
+                     sorted in ascending order within each row.
+    :param levels: (numpy array) reference levels to evaluate.
+    """
+    heights = z_sorted[np.newaxis, :, :] - levels[:, np.newaxis, np.newaxis]
+    h1 = heights[:, :, 0]
+    h2 = heights[:, :, 1]
+    h3 = heights[:, :, 2]
+    mean = (h1 + h2 + h3)/3.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Mean height of the part above the plane, relative to the area of
+        # the whole triangle. When a single vertex lies below the plane, the
+        # sub-triangle cut off around it is subtracted from the full prism.
+        one_below = mean - h1**3/(3.0*(h2 - h1)*(h3 - h1))
+        two_below = h3**3/(3.0*(h3 - h1)*(h3 - h2))
+        above = np.where(h1 >= 0.0, mean,
+                np.where(h2 >= 0.0, one_below,
+                np.where(h3 > 0.0, two_below, 0.0)))
+    return (above, mean)
+
+def _get_cubic_coefficients(scale, root):
+    """
+    Returns an Nx4 numpy array with the coefficients of the polynomials
+    scale*(x - root)**3, in ascending order of degree.
+    """
+    return np.column_stack((-scale*root**3,
+                            3.0*scale*root**2,
+                            -3.0*scale*root,
+                            scale))
+
+def get_grid_cut_fill_volumes(heights, cell_area, ref_levels):
+    """
+    Returns a tuple of numpy arrays (cut, fill) with one volume per reference
+    level for a surface sampled on a regular grid: each cell contributes its
+    height above (cut) or below (fill) the level times its area.
+
+    :param heights: (numpy array) elevation of every cell inside the surface,
+                    sorted in ascending order.
+    :param cell_area: (float) area of a cell.
+    :param ref_levels: (float or numpy array) reference level(s) to evaluate.
+    """
+    levels = np.atleast_1d(np.asarray(ref_levels, dtype=np.float64))
+    cumulative = np.concatenate(([0.0], np.cumsum(heights)))
+    below = np.searchsorted(heights, levels, side='right')
+    above = len(heights) - below
+    cut = (cumulative[-1] - cumulative[below] - levels*above)*cell_area
+    fill = (levels*below - cumulative[below])*cell_area
+    return (cut, fill)
+
+class HypsometricIndex():
+    """
+    Cut and fill volumes of a triangulated surface as functions of the
+    reference level, ready to be queried at any level.
+
+    The cut volume of a triangle is a piecewise polynomial of the level, of
+    degree 3 at most, whose breakpoints are the elevations of its vertices.
+    The index holds every breakpoint in ascending order along with the
+    cumulative polynomial coefficients of all triangles past it, so a query
+    is a binary search followed by the evaluation of a single cubic. The
+    fill volume follows from the cut volume, the total volume and the
+    footprint area. Building it takes O(n log n) for n triangles and a query
+    takes O(log n).
+
+    The cubic of a triangle with two vertices at nearly the same elevation
+    has very large coefficients, which would cancel out poorly once added to
+    every other. Such pieces are kept apart in a short list of narrow level
+    windows that are evaluated one by one when a query falls inside them.
+
+    Triangles replaced later on (see update) are held in small indexes of
+    their own, whose volumes are subtracted or added at every query.
+    """
+    __slots__ = ('center', 'volume', 'area', 'breakpoints', 'coefficients',
+                 'windows', 'width', 'changes')
+
+    def __init__(self, z_sorted, areas):
+        """Constructor
+
+        :param z_sorted: (numpy array) Nx3 vertex heights, one row per
+                         triangle, sorted in ascending order within each row.
+        :param areas: (numpy array) projected area of each triangle.
+        """
+        z_sorted = np.asarray(z_sorted, dtype=np.float64).reshape(-1, 3)
+        areas = np.asarray(areas, dtype=np.float64)
+        (z1, z2, z3) = z_sorted.T
+        (low, high) = (0.0, 0.0)
+        if len(areas) > 0:
+            (low, high) = (float(z1.min()), float(z3.max()))
+        self.center = 0.5*(low + high)
+        self.changes = []
+        self.volume = float(_get_prism_volumes(areas, z_sorted).sum())
+        self.area = float(areas.sum())
+
+        # Cut volume of a triangle, with d21 = z2 - z1 and so on:
+        # base = area*(mean - level) up to z1,
+        # base + area*(level - z1)**3/(3*d21*d31) up to z2,
+        # area*(z3 - level)**3/(3*d31*d32) up to z3 and 0 past it.
+        # Polynomials are expanded around center, where levels are queried.
+        (d21, d31, d32) = (z2 - z1, z3 - z1, z3 - z2)
+        limit = _INDEX_THIN_PIECE*(high - low)**2
+        thin = (d21*d31 <= limit, d31*d32 <= limit)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scales = (np.where(thin[0], 0.0, areas/(3.0*d21*d31)),
+                      np.where(thin[1], 0.0, areas/(3.0*d31*d32)))
+        lower = _get_cubic_coefficients(scales[0], z1 - self.center)
+        upper = -_get_cubic_coefficients(scales[1], z3 - self.center)
+        base = np.zeros((len(areas), 4))
+        base[:, 0] = areas*(z_sorted.sum(axis=1)/3.0 - self.center)
+        base[:, 1] = -areas
+
+        breakpoints = np.concatenate((z1, z2, z3))
+        increments = np.concatenate((lower, upper - base - lower, -upper))
+        order = np.argsort(breakpoints, kind='stable')
+        self.breakpoints = breakpoints[order]
+        self.coefficients = np.cumsum(
+            np.vstack((base.sum(axis=0), increments[order])), axis=0)
+
+        # rows start, stop, anchor and scale of the thin pieces, by start
+        windows = []
+        for (is_thin, start, stop, anchor, width) in [
+            (thin[0], z1, z2, z1, d21), (thin[1], z2, z3, z3, d32)]:
+            kept = is_thin & (width > 0.0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                scale = areas[kept]/(3.0*d31[kept]*width[kept])
+            windows.append(np.vstack((start[kept], stop[kept], anchor[kept],
+                                      scale)))
+        windows = np.hstack(windows)
+        self.windows = windows[:, np.argsort(windows[0], kind='stable')]
+        self.width = float((self.windows[1] - self.windows[0]).max(initial=0.0))
+
+    def __len__(self):
+        return len(self.breakpoints)//3 + int(sum(sign*len(change) for
+                                                  (sign, change) in
+                                                  self.changes))
+
+    def update(self, removed, added):
+        """
+        Updates the index after triangles of the surface were replaced, in
+        O(k log k) for k changed triangles instead of building it again.
+        Queries slow down a little with every update, so the index is best
+        built again once many triangles changed.
+
+        :param removed: tuple (z_sorted, areas) of the triangles removed.
+        :param added: tuple (z_sorted, areas) of the triangles added.
+        """
+        for (sign, (z_sorted, areas)) in [(-1.0, removed), (1.0, added)]:
+            if len(areas) > 0:
+                self.changes.append((sign, HypsometricIndex(z_sorted, areas)))
+
+    def get_area(self):
+        """Returns the projected area of the surface, updates included."""
+        return self.area + sum(sign*change.area
+                               for (sign, change) in self.changes)
+
+    def get_cut_fill_volumes(self, ref_levels):
+        """
+        Returns a tuple of numpy arrays (cut, fill) with one volume per
+        reference level.
+
+        :param ref_levels: (float or numpy array) reference level(s) to
+                           evaluate.
+        """
+        levels = np.atleast_1d(np.asarray(ref_levels, dtype=np.float64))
+        return self._get_cut_fill_volumes(levels, self._get_cut(levels))
+
+    def _get_cut(self, levels):
+        """
+        Returns the cut volume of the triangles of this index alone, leaving
+        out the updates, at every level.
+        """
+        coefficients = self.coefficients[
+            np.searchsorted(self.breakpoints, levels, side='left')]
+        offset = levels - self.center
+        cut = (coefficients[:, 0] + offset*(coefficients[:, 1] +
+               offset*(coefficients[:, 2] + offset*coefficients[:, 3])))
+        cut += self._get_window_volumes(levels)
+        # exact at and beyond the lowest and highest vertices
+        if len(self.breakpoints) > 0:
+            cut = np.where(levels <= self.breakpoints[0],
+                           self.volume - self.area*levels,
+                           cut)
+            cut = np.where(levels >= self.breakpoints[-1], 0.0, cut)
+        return cut
+
+    def _get_cut_fill_volumes(self, levels, cut):
+        """
+        Returns a tuple of numpy arrays (cut, fill) out of the cut volume of
+        the triangles of this index alone at every level, adding the updates.
+        """
+        (volume, area) = (self.volume, self.area)
+        bounds = [index.breakpoints[[0, -1]] for index in
+                  [self] + [change for (sign, change) in self.changes
+                            if sign > 0.0]
+                  if len(index.breakpoints) > 0]
+        for (sign, change) in self.changes:
+            cut = cut + sign*change._get_cut(levels)
+            volume += sign*change.volume
+            area += sign*change.area
+        below = volume - area*levels # cut - fill at every level
+        if len(bounds) > 0:
+            # exact at and beyond the lowest and highest vertices
+            bounds = np.array(bounds)
+            cut = np.where(levels <= bounds[:, 0].min(), below, cut)
+            cut = np.where(levels >= bounds[:, 1].max(), 0.0, cut)
+        cut = np.maximum(cut, 0.0)
+        fill = np.maximum(cut - below, 0.0)
+        return (cut, fill)
+
+    def _get_window_volumes(self, levels):
+        """
+        Returns the cut volume of the thin pieces whose window, from start
+        (excluded) to stop, holds each level.
+        """
+        (start, stop, anchor, scale) = self.windows
+        first = np.searchsorted(start, levels - self.width, side='left')
+        counts = np.searchsorted(start, levels, side='left') - first
+        volumes = np.zeros(len(levels))
+        if counts.sum() == 0:
+            return volumes
+        query = np.repeat(np.arange(len(levels)), counts)
+        window = (np.arange(counts.sum()) -
+                  np.repeat(np.cumsum(counts) - counts - first, counts))
+        level = levels[query]
+        inside = level <= stop[window]
+        np.add.at(volumes, query[inside],
+                  scale[window[inside]]*
+                  np.abs(level[inside] - anchor[window[inside]])**3)
+        return volumes
+
+def _get_shared_cut(descriptors, scalars, levels):
+    """
+    Worker process entry point of the parallel volume curves. Attaches to the
+    arrays of the HypsometricIndex shared by the parent process instead of
+    receiving pickled copies, and returns the cut volume of its triangles,
+    leaving out the updates.
+    """
+    index = HypsometricIndex.__new__(HypsometricIndex)
+    index.changes = []
+    for (name, value) in zip(_INDEX_SCALARS, scalars):
+        setattr(index, name, value)
+    memories = []
+    try:
+        for (name, descriptor) in zip(_INDEX_ARRAYS, descriptors):
+            (memory, array) = attach_array(descriptor)
+            memories.append(memory)
+            setattr(index, name, array)
+        return index._get_cut(levels)
+    finally:
+        del index
+        for memory in memories:
+            memory.close()
+
+def _get_boundary_vertices(simplices, points):
+    """
+    Returns the sorted indexes of the vertices on the boundary of the
+    triangulation simplices, the ones of the edges used by a single triangle.
+
+    :param points: (int) number of points the simplices index.
+    """
+    edges = np.sort(simplices[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2),
+                    axis=1).astype(np.int64)
+    (keys, counts) = np.unique(edges[:, 0]*points + edges[:, 1],
+                               return_counts=True)
+    boundary = keys[counts == 1]
+    return np.unique(np.concatenate((boundary // points, boundary % points)))
+
+def _get_changed_simplices(old, new):
+    """
+    Returns a tuple of boolean arrays (removed, added) telling which rows of
+    the Nx3 simplices old are missing from new and which rows of new are
+    missing from old, whatever the order of the rows and of their vertices.
+    """
+    def get_keys(simplices):
+        rows = np.ascontiguousarray(np.sort(simplices, axis=1), np.int64)
+        return rows.view('V24').ravel()
+    (old_keys, new_keys) = (get_keys(old), get_keys(new))
+    return (~np.isin(old_keys, new_keys), ~np.isin(new_keys, old_keys))
+
+def _insert_points(x, y, simplices, areas, hull, start):
+    """
+    Returns a tuple (removed, added, hull) that updates the Delaunay
+    triangulation simplices of the points before start with the points from
+    start on: a boolean array of the simplices to remove, the Nx3 simplices
+    to add and the indexes of the new boundary vertices. Returns None when
+    the update does not tile the new convex hull, as may happen when 4 or
+    more points share a circumcircle.
+
+    The triangles whose circumcircle holds a new point are the only ones
+    that stop being Delaunay. Every new triangle has a new vertex, so they
+    are the ones with a new vertex of the Delaunay triangulation of the new
+    points, the vertices of the removed triangles and the boundary vertices.
+
+    :param x, y: (numpy arrays) coordinates of every point.
+    :param areas: (numpy array) projected area of each of the simplices.
+    :param hull: (numpy array) indexes of the boundary vertices.
+    """
+    new = np.arange(start, len(x))
+    (center_x, center_y, radius) = _get_circumcircles(x[simplices],
+                                                      y[simplices])
+    # Only circumcircles reaching the bounding box of the new points
+    # may hold one of them.
+    with np.errstate(invalid='ignore'):
+        near = np.flatnonzero((center_x + radius > x[new].min()) &
+                              (center_x - radius < x[new].max()) &
+                              (center_y + radius > y[new].min()) &
+                              (center_y - radius < y[new].max()))
+    tree = cKDTree(np.column_stack((x[new], y[new])))
+    (distance, _) = tree.query(np.column_stack((center_x[near],
+                                                center_y[near])))
+    removed = np.zeros(len(simplices), dtype=bool)
+    removed[near[distance < radius[near]]] = True
+
+    points = np.unique(np.concatenate((simplices[removed].ravel(), hull, new)))
+    local = Delaunay(np.column_stack((x[points], y[points])))
+    triangles = points[local.simplices]
+    added = triangles[(triangles >= start).any(axis=1)]
+
+    local_area = get_projected_areas(x, y, triangles).sum()
+    area = (areas[~removed].sum() +
+            get_projected_areas(x, y, added).sum())
+    if not np.isclose(area, local_area, rtol=1e-9, atol=0.0):
+        return None
+    return (removed, added, points[np.unique(local.convex_hull)])
+
 class TriangularMesh(object):
 
+    _hull = None # boundary vertices, found on the first insertion
+    _results = None # cached volume and cut/fill of the point_cloud
+
     def __init__(self, point_cloud):
         """
         :param point_cloud: a pandas dataframe containing x, y, z, elevation
@@ -118,14 +704,400 @@ class TriangularMesh(object):
                     Not set by the user.
         """
         self.point_cloud = point_cloud
-        self.data = Delaunay(point_cloud[['x', 'y']]).simplices
-        self._flat_volume = {0.0: 0.0} # dictionary containing ref_level and
-        # corresponding flat volume. Used by the cut and fill routines.
-        # Defined as an attribute to reduce the need to recalculate
-        # CONSIDER CREATING additional dictionaries to allow faster performance on new calculations for the same point_cloud
+        self._triangulate()
+
+    def save(self, path):
+        """
+        Stores the mesh in the directory path: the point cloud, simplices and
+        projected areas as memory-mappable arrays and a fingerprint of the
+        point cloud. Reopen it with TriangularMesh.load.
+
+        :param path: (str) directory of the cached mesh.
+        """
+        (data, areas) = self._get_topology(self.point_cloud)
+        with stage('mesh.save', triangles=len(data)):
+            cache.save_mesh(path, self.point_cloud, data, areas)
+
+    @classmethod
+    def load(cls, path, point_cloud=None):
+        """
+        Returns a TriangularMesh reopened from a directory written by save,
+        without triangulating again. The arrays are memory mapped, so worker
+        processes opening the same mesh share one read-only copy.
+
+        :param path: (str) directory of the cached mesh.
+        :param point_cloud: (pandas DataFrame) the source point cloud. When
+                            given, it must match the fingerprint of the point
+                            cloud the mesh was built from (ValueError
+                            otherwise) and it becomes the mesh point_cloud.
+                            Default: the cached point cloud.
+        """
+        with stage('mesh.load'):
+            (cached_points, data, areas, metadata) = cache.load_mesh(path)
+            if point_cloud is None:
+                point_cloud = cached_points
+            elif (cache.get_point_cloud_fingerprint(point_cloud) !=
+                  metadata['fingerprint']):
+                raise ValueError(
+                    "The cached mesh was not built from the given point cloud.")
+        mesh = cls.__new__(cls)
+        mesh.point_cloud = point_cloud
+        mesh._xy = cached_points[['x', 'y']].to_numpy()
+        mesh.data = data
+        mesh._areas = areas
+        mesh._delaunay = None # rebuilt on the first elevation query
+        mesh.triangular_areas = len(data)
+        return mesh
+
+    def _triangulate(self):
+        """
+        Builds the Delaunay triangulation on the x, y coordinates of the
+        point_cloud and caches the topology along with each triangle's
+        projected area. Only a change to x or y requires calling it again.
+        """
+        with stage('mesh.triangulate') as triangulate:
+            self._xy = self.point_cloud[['x', 'y']].to_numpy(dtype=np.float64,
+                                                             copy=True)
+            self._delaunay = Delaunay(self._xy)
+            self.data = self._delaunay.simplices
+            self._areas = get_projected_areas(self._xy[:, 0],
+                                              self._xy[:, 1],
+                                              self.data)
+            self.triangular_areas = len(self.data)
+            self._hull = None
+            self._results = None
+            triangulate.count(points=len(self._xy), triangles=len(self.data))
+
+    def _is_moved(self):
+        """
+        Returns whether x or y of the point_cloud changed since the last
+        triangulation. Each column is compared in place, without a copy.
+        """
+        return not all(np.array_equal(self.point_cloud[column].to_numpy(),
+                                      self._xy[:, axis])
+                       for (axis, column) in enumerate(['x', 'y']))
+
+    def _get_topology(self, data_points):
+        """
+        Returns a tuple with the simplices and projected areas for
+        data_points. The cached triangulation is reused whenever the x, y
+        layout of data_points matches the one of the point_cloud, which is
+        the case for every cut/fill query since those only change z.
+
+        :param data_points: (pandas DataFrame) x, y, z, elevation columns.
+        """
+        if self._is_moved():
+            self._triangulate() # point_cloud x, y changed since last build
+        if data_points is self.point_cloud:
+            return (self.data, self._areas)
+        xy = data_points[['x', 'y']].to_numpy(dtype=np.float64)
+        if np.array_equal(xy, self._xy):
+            return (self.data, self._areas)
+        with stage('mesh.triangulate') as triangulate:
+            simplices = Delaunay(xy).simplices
+            triangulate.count(points=len(xy), triangles=len(simplices))
+        return (simplices,
+                get_projected_areas(xy[:, 0], xy[:, 1], simplices))
+
+    def _get_delaunay(self):
+        """
+        Returns the scipy Delaunay object of the point_cloud, triangulating
+        again if x or y changed or if the mesh was reopened from a cache.
+        """
+        if self._is_moved():
+            self._triangulate()
+        elif self._delaunay is None:
+            with stage('mesh.triangulate') as triangulate:
+                self._delaunay = Delaunay(self._xy)
+                triangulate.count(points=len(self._xy),
+                                  triangles=len(self._delaunay.simplices))
+        return self._delaunay
+
+    def _get_hull(self):
+        """Returns the indexes of the vertices on the mesh boundary."""
+        if self._hull is None:
+            if self._delaunay is not None:
+                self._hull = np.unique(self._delaunay.convex_hull)
+            else:
+                self._hull = _get_boundary_vertices(self.data, len(self._xy))
+        return self._hull
+
+    def _get_results(self):
+        """
+        Returns the dict of cached results of the analytic method on the
+        point_cloud: its volume and its HypsometricIndex. The cache is emptied
+        whenever z changed since then.
+        """
+        z = self.point_cloud['z'].to_numpy(dtype=np.float64)
+        if self._results is None or not np.array_equal(self._results['z'], z):
+            self._results = {'z': z.copy(), 'volume': None, 'index': None}
+        return self._results
+
+    def get_index(self):
+        """
+        Returns the HypsometricIndex of the point_cloud, which answers cut
+        and fill queries at any reference level in O(log n) for n triangles.
+        It is built on the first analytic cut/fill query, in O(n log n), and
+        kept until z changes or points are added.
+
+        Every query through the mesh (get_cut_volume, get_fill_volume,
+        get_volume_curves) first checks that x, y and z did not change, an
+        O(n) comparison. Interactive tools querying many levels of a cloud
+        that no longer changes should keep the index and query it directly.
+        """
+        (data, areas) = self._get_topology(self.point_cloud)
+        results = self._get_results()
+        if results['index'] is None:
+            with stage('mesh.index', triangles=len(data)):
+                z = self.point_cloud['z'].to_numpy(dtype=np.float64)
+                results['index'] = HypsometricIndex(np.sort(z[data], axis=1),
+                                                    areas)
+        return results['index']
+
+    def add_points(self, points):
+        """
+        Appends points to the point_cloud, e.g. another day of survey data of
+        the same site, and updates the mesh in place. Only the triangles
+        whose circumcircle holds a new point are triangulated again, together
+        with the new points. The cached volume and HypsometricIndex are
+        updated with the triangles removed and added instead of being
+        computed again (see HypsometricIndex.update), until a quarter of the
+        triangles of the index changed: it is then built again on the next
+        cut/fill query. The scipy Delaunay object used by elevation queries
+        is rebuilt on the next query.
+
+        :param points: (pandas DataFrame) x, y, z, elevation columns in the
+                       coordinates of the point_cloud. See Survey.get_data to
+                       express another survey with the offset of this one.
+        """
+        missing = set(self.point_cloud.columns) - set(points.columns)
+        if missing:
+            raise ValueError("Missing point columns: {}.".format(
+                ', '.join(sorted(missing))))
+        (data, areas) = self._get_topology(self.point_cloud)
+        results = self._get_results()
+        start = len(self.point_cloud)
+        with stage('mesh.add_points', points=len(points)) as insert:
+            self.point_cloud = pd.concat(
+                [self.point_cloud, points[self.point_cloud.columns]],
+                ignore_index=True)
+            if len(points) == 0:
+                return
+            (removed, added) = self._add_points(data, areas, start)
+            insert.count(removed=np.count_nonzero(removed),
+                         added=np.count_nonzero(added))
+
+            # Only the triangles that changed update the cached results.
+            z = self.point_cloud['z'].to_numpy(dtype=np.float64)
+            removed = (np.sort(z[data[removed]], axis=1), areas[removed])
+            added = (np.sort(z[self.data[added]], axis=1), self._areas[added])
+            if results['volume'] is not None:
+                results['volume'] += float(
+                    _get_prism_volumes(added[1], added[0]).sum() -
+                    _get_prism_volumes(removed[1], removed[0]).sum())
+            index = results['index']
+            if index is not None:
+                changed = len(removed[1]) + len(added[1]) + sum(
+                    len(change) for (_, change) in index.changes)
+                if (changed > _INDEX_MAX_CHANGES*len(index) or
+                    len(index.changes) + 2 > _INDEX_MAX_UPDATES):
+                    results['index'] = None
+                else:
+                    with stage('mesh.index_update', triangles=changed):
+                        index.update(removed, added)
+            results['z'] = z.copy()
+            self._results = results
+
+    def _add_points(self, data, areas, start):
+        """
+        Updates the topology with the points of the point_cloud from start
+        on and returns a tuple of boolean arrays (removed, added) telling
+        which of the previous simplices data were removed and which of the
+        new ones were added. Triangulates everything again when the local
+        update does not apply.
+        """
+        xy = self.point_cloud[['x', 'y']].to_numpy(dtype=np.float64,
+                                                   copy=True)
+        update = _insert_points(xy[:, 0], xy[:, 1], data, areas,
+                                self._get_hull(), start)
+        if update is None:
+            self._triangulate()
+            return _get_changed_simplices(data, self.data)
+        (removed, added, hull) = update
+        dtype = np.int32 if len(xy) < 2**31 else np.int64
+        self._xy = xy
+        self._delaunay = None
+        self._hull = hull
+        self.data = np.concatenate((data[~removed], added)).astype(dtype)
+        self._areas = np.concatenate(
+            (areas[~removed], get_projected_areas(xy[:, 0], xy[:, 1], added)))
         self.triangular_areas = len(self.data)
+        is_added = np.zeros(len(self.data), dtype=bool)
+        is_added[len(self.data) - len(added):] = True
+        return (removed, is_added)
+
+    def _interpolate(self, points, chunk_size):
+        """
+        Returns a tuple of numpy arrays (inside, elevation) for an Nx2 array
+        of points: whether each point lies inside the mesh and its
+        interpolated z (undefined outside).
+        """
+        delaunay = self._get_delaunay()
+        z = self.point_cloud['z'].to_numpy(dtype=np.float64)
+        inside = np.zeros(len(points), dtype=bool)
+        elevation = np.empty(len(points), dtype=np.float64)
+        # The point location walks from the simplex found for the previous
+        # point, so spatially sorted queries are much faster.
+        order = _get_spatial_order(points)
+        for start in range(0, len(points), chunk_size):
+            indexes = order[start:start + chunk_size]
+            (inside[indexes], values) = _interpolate(delaunay, z,
+                                                     points[indexes])
+            elevation[indexes[inside[indexes]]] = values
+        return (inside, elevation)
+
+    def get_elevation(self, x, y, chunk_size=2**20, fill_value=np.nan,
+                      outside='fill'):
+        """
+        Returns the z coordinate of the mesh surface at the points (x, y),
+        linearly interpolated within the triangle that contains each point.
+        Queries are located with the Delaunay point location and its cached
+        barycentric transforms, in chunks of chunk_size points.
+
+        :param x: (float or array-like) x coordinate of the query points.
+        :param y: (float or array-like) y coordinate of the query points.
+        :param chunk_size: (int) number of points processed at once, bounding
+                           the memory of the intermediate arrays.
+        :param fill_value: (float) z returned for points outside the convex
+                           hull of the point_cloud when outside is 'fill'.
+                           Default: NaN
+        :param outside: (str) 'fill' (default) returns fill_value for points
+                        outside the hull. 'raise' raises a ValueError instead.
+        """
+        if outside not in ('fill', 'raise'):
+            raise ValueError(
+                "Unknown outside option. Expected 'fill' or 'raise'.")
+        (x, y) = np.broadcast_arrays(np.asarray(x, dtype=np.float64),
+                                     np.asarray(y, dtype=np.float64))
+        shape = x.shape
+        points = np.column_stack((x.ravel(), y.ravel()))
+        with stage('mesh.elevation', points=len(points)):
+            (inside, elevation) = self._interpolate(points,
+                                                    max(1, int(chunk_size)))
+        if outside == 'raise' and not inside.all():
+            raise ValueError("{} point(s) lie outside the mesh.".format(
+                np.count_nonzero(~inside)))
+        elevation[~inside] = fill_value
+        if shape == ():
+            return float(elevation[0])
+        return elevation.reshape(shape)
 
-    def get_volume(self, data_points='Default', show_progress=True):
+    def rasterize(self,
+                  cell_size,
+                  path=None,
+                  bounds=None,
+                  tile_rows=None,
+                  dtype=np.float32,
+                  fill_value=np.nan,
+                  offset=None,
+                  utm_zone=None):
+        """
+        Returns a Raster with the mesh elevation sampled at the center of
+        every cell of a regular grid. Rows are interpolated in tiles of
+        tile_rows rows with get_elevation, so memory stays bounded.
+
+        :param cell_size: (float) side of the square cells.
+        :param path: (str) directory the raster is written to, tile by tile,
+                     as a memory-mapped elevation.npy with a raster.json
+                     holding the metadata. Default: None (kept in memory).
+        :param bounds: tuple (x_min, y_min, x_max, y_max) of the grid.
+                       Default: the extent of the point_cloud.
+        :param tile_rows: (int) rows interpolated at once. Default: as many
+                          as fit about a million cells.
+        :param dtype: numpy dtype of the elevations. Default: float32
+        :param fill_value: (float) elevation of cells outside the mesh.
+        :param offset: tuple (x, y, z) subtracted from the source coordinates,
+                       stored for georeferencing (e.g. Survey.offset).
+        :param utm_zone: tuple (zone_number, zone_letter) of the source
+                         coordinates (e.g. Survey.utm_zone).
+        """
+        if cell_size <= 0:
+            raise ValueError("cell_size must be positive.")
+        if bounds is None:
+            bounds = (self._xy[:, 0].min(), self._xy[:, 1].min(),
+                      self._xy[:, 0].max(), self._xy[:, 1].max())
+        (x_min, y_min, x_max, y_max) = [float(value) for value in bounds]
+        shape = (max(1, int(np.ceil((y_max - y_min)/cell_size))),
+                 max(1, int(np.ceil((x_max - x_min)/cell_size))))
+        arguments = {'offset': offset,
+                     'utm_zone': utm_zone,
+                     'fill_value': fill_value}
+        if path is None:
+            raster = Raster(np.empty(shape, dtype=dtype),
+                            (x_min, y_max),
+                            cell_size,
+                            **arguments)
+        else:
+            raster = Raster.create(path, shape, dtype, (x_min, y_max),
+                                   cell_size, **arguments)
+        if tile_rows is None:
+            tile_rows = max(1, 2**20 // shape[1])
+        x = raster.get_x()
+        y = raster.get_y()
+        with stage('mesh.rasterize', cells=shape[0]*shape[1]):
+            for start in range(0, shape[0], tile_rows):
+                stop = min(start + tile_rows, shape[0])
+                raster.elevation[start:stop] = self.get_elevation(
+                    x[np.newaxis, :],
+                    y[start:stop, np.newaxis],
+                    fill_value=fill_value)
+        if path is not None:
+            raster.save(path)
+        return raster
+
+    def _get_cell_size(self, cell_size):
+        """Returns cell_size, or the default cell size of the 'grid' method."""
+        if cell_size is None:
+            # about one cell per point of the point cloud
+            cell_size = np.sqrt(self._areas.sum()/len(self._xy))
+        return cell_size
+
+    def _get_grid_heights(self, cell_size):
+        """
+        Returns a tuple (heights, cell_area) with the sorted elevations of the
+        cells of the mesh raster at cell_size that lie inside the mesh.
+        """
+        raster = self.rasterize(self._get_cell_size(cell_size),
+                                dtype=np.float64)
+        heights = raster.elevation[~np.isnan(raster.elevation)]
+        heights.sort()
+        return (heights, raster.cell_size**2)
+
+    def _get_grid_volumes(self, cell_size, levels):
+        """
+        Returns a tuple (volume, cut, fill, errors) out of the mesh raster at
+        cell_size, where errors is a tuple (volume, cut, fill) of estimates of
+        the absolute error against the exact method. The estimates are the
+        differences to the same volumes on a raster with twice the cell size.
+        """
+        cell_size = self._get_cell_size(cell_size)
+        results = []
+        for size in [cell_size, 2.0*cell_size]:
+            (heights, cell_area) = self._get_grid_heights(size)
+            (cut, fill) = get_grid_cut_fill_volumes(heights, cell_area, levels)
+            results.append((heights.sum()*cell_area, cut, fill))
+        ((volume, cut, fill), coarse) = results
+        errors = (abs(volume - coarse[0]),
+                  np.abs(cut - coarse[1]),
+                  np.abs(fill - coarse[2]))
+        return (volume, cut, fill, errors)
+
+    def get_volume(self,
+                   data_points='Default',
+                   show_progress=True,
+                   method='analytic',
+                   cell_size=None,
+                   return_error=False):
         """
         Returns the volume.
 
@@ -134,15 +1106,64 @@ class TriangularMesh(object):
                             reason it is given as an input is to reuse this
                             get_volume method to calculate cut and fill volumes.
                             (default) the hole point_cloud.
-        :param show_progress: (bool) shows the progress bar when True.
+        :param show_progress: shows the progress bar when True. Also accepts
+                              a callable receiving (done, total), a
+                              logging.Logger or a utils.Progress.
+        :param method: (str) 'analytic' (default) computes every triangle's
+                       prism volume in one batched NumPy pass (projected area
+                       times mean height). 'symbolic' applies the sympy double
+                       integrals triangle by triangle and is kept as a
+                       reference for verification. 'grid' sums a raster of
+                       the surface at cell_size, a quick approximation.
+        :param cell_size: (float) cell side of the 'grid' method. Default:
+                          about one cell per point of the point cloud.
+        :param return_error: (bool) returns a tuple (volume, error) where
+                             error estimates the absolute error of the 'grid'
+                             method against the exact ones (0.0 for the exact
+                             methods). Default: False
         """
         if type(data_points) is not pd.core.frame.DataFrame:
             data_points=self.point_cloud
 
-        data = Delaunay(data_points[['x', 'y']]).simplices # I think I can remove this. Do it after done with the corresponding cut/fill unit tests.
+        if method == 'grid':
+            mesh = self
+            if data_points is not self.point_cloud:
+                mesh = TriangularMesh(data_points)
+            with stage('mesh.volume_grid'):
+                (volume, _, _, errors) = mesh._get_grid_volumes(cell_size,
+                                                                0.0)
+            volume = float(volume)
+            return (volume, float(errors[0])) if return_error else volume
+
+        (data, areas) = self._get_topology(data_points)
+        if method == 'analytic':
+            results = {'volume': None}
+            if data_points is self.point_cloud:
+                results = self._get_results()
+            if results['volume'] is None:
+                with stage('mesh.volume', triangles=len(data)):
+                    z = data_points['z'].to_numpy(dtype=np.float64)
+                    results['volume'] = float(
+                        _get_prism_volumes(areas, z[data]).sum())
+            volume = results['volume']
+        elif method == 'symbolic':
+            with stage('mesh.volume_symbolic', triangles=len(data)):
+                volume = self._get_symbolic_volume(data_points,
+                                                   data,
+                                                   show_progress)
+        else:
+            raise ValueError("Unknown volume method. "
+                             "Expected 'analytic', 'symbolic' or 'grid'.")
+        return (volume, 0.0) if return_error else volume
+
+    def _get_symbolic_volume(self, data_points, data, show_progress):
+        """
+        Returns the volume of data_points over the simplices data by applying
+        the sympy double integrals of Triangle.get_volume to every triangle.
+        """
         mesh_volume = 0
-        iteration = 0
         data_amount = len(data)
+        progress = get_progress(show_progress, data_amount)
         for i in range(data_amount):
             A = data_points.iloc[data[i][0]]
             B = data_points.iloc[data[i][1]]
@@ -153,65 +1174,85 @@ class TriangularMesh(object):
             triangle = Triangle(point_A, point_B, point_C)
             volume = triangle.get_volume()
             mesh_volume += volume
-
-            # update progress bar
-            if show_progress:
-                iteration += 1
-                print_progress(iteration,
-                            data_amount,
-                            prefix='Progress:',
-                            suffix='Complete',
-                            length = 50)
+            progress.update()
         return mesh_volume
 
-    def _get_flat_volume(self, ref_level):
+    def _get_cut_fill_volumes(self, ref_level, method='analytic',
+                              cell_size=None):
         """
-        Sets the internal attribute for flat_volume.
+        Returns a tuple ((cut, fill), (cut_error, fill_error)) for a single
+        ref_level out of the cached topology and the current z values of the
+        point_cloud, or out of its raster with the 'grid' method.
         """
-        data_flat = self.point_cloud.copy(deep=True)
-        data_flat['z'] = ref_level
-        self._flat_volume[ref_level] = self.get_volume(
-            data_flat, show_progress=False)
+        if method == 'grid':
+            with stage('mesh.cut_fill_grid', levels=1):
+                (_, cut, fill, errors) = self._get_grid_volumes(cell_size,
+                                                                ref_level)
+            return ((float(cut[0]), float(fill[0])),
+                    (float(errors[1][0]), float(errors[2][0])))
+        elif method != 'analytic':
+            raise ValueError(
+                "Unknown volume method. Expected 'analytic' or 'grid'.")
+        index = self.get_index()
+        with stage('mesh.cut_fill', triangles=len(index), levels=1):
+            (cut, fill) = index.get_cut_fill_volumes(ref_level)
+        return ((float(cut[0]), float(fill[0])), (0.0, 0.0))
 
-    def get_cut_volume(self, ref_level, show_progress=True):
+    def get_cut_volume(self,
+                       ref_level,
+                       show_progress=True,
+                       method='analytic',
+                       cell_size=None,
+                       return_error=False):
         """
-        Returns the terrain fill volume, corresponding to the amount of volume
-        required to fill the terrain up to the ref_level
+        Returns the terrain cut volume, corresponding to the amount of volume
+        above the ref_level that needs to be removed to level the terrain.
 
         :param ref_level: the reference level to be used. This is relative to
         the lowest point available in z.
+        :param show_progress: kept for compatibility. The volume is computed
+                              in a single array pass.
+        :param method: (str) 'analytic' (default) or 'grid'. See get_volume.
+        :param cell_size: (float) cell side of the 'grid' method.
+        :param return_error: (bool) returns a tuple (volume, error). See
+                             get_volume. Default: False
         """
-        data_cut = self.point_cloud.copy(deep=True)
-        data_cut.loc[data_cut['z'] < ref_level, 'z'] = ref_level
-        if ref_level not in self._flat_volume.keys():
-            self._get_flat_volume(ref_level)
-        flat_volume = self._flat_volume[ref_level]
-        full_cut = self.get_volume(data_cut, show_progress=show_progress)
-        return np.int64(full_cut - flat_volume)
+        ((cut, _), (error, _)) = self._get_cut_fill_volumes(ref_level,
+                                                            method,
+                                                            cell_size)
+        return (cut, error) if return_error else cut
 
-    def get_fill_volume(self, ref_level, show_progress=True):
+    def get_fill_volume(self,
+                        ref_level,
+                        show_progress=True,
+                        method='analytic',
+                        cell_size=None,
+                        return_error=False):
         """
         Returns the terrain fill volume, corresponding to the amount of volume
         required to fill the terrain up to the ref_level
 
         :param ref_level: the reference level to be used. This is relative to
         the lowest point available in z.
+        :param show_progress: kept for compatibility. The volume is computed
+                              in a single array pass.
+        :param method: (str) 'analytic' (default) or 'grid'. See get_volume.
+        :param cell_size: (float) cell side of the 'grid' method.
+        :param return_error: (bool) returns a tuple (volume, error). See
+                             get_volume. Default: False
         """
-        if ref_level == 0.0: return 0.0 # quick exit when ref is 0.0.
-
-        data_fill = self.point_cloud.copy(deep=True)
-        data_fill.loc[data_fill['z'] >= ref_level, 'z'] = ref_level
-        if ref_level not in self._flat_volume.keys():
-            self._get_flat_volume(ref_level)
-        flat_volume = self._flat_volume[ref_level]
-        full_fill = self.get_volume(data_fill, show_progress=show_progress)
-        return np.int64(flat_volume - full_fill)
+        ((_, fill), (_, error)) = self._get_cut_fill_volumes(ref_level,
+                                                             method,
+                                                             cell_size)
+        return (fill, error) if return_error else fill
 
-
-    # Create TEST CASES for cut and fill volumes. Keep in mind how you are
-    # flattening the projection to make sure the numbers match.
-
-    def get_volume_curves(self, step=1.0):
+    def get_volume_curves(self,
+                          step=1.0,
+                          show_progress=True,
+                          workers=1,
+                          method='analytic',
+                          cell_size=None,
+                          return_error=False):
         """
         Returns a pandas DataFrame representing containing the following
         columns:
@@ -221,33 +1262,200 @@ class TriangularMesh(object):
         This can be used to plot required cut/fill volumes to flatten the
         surveyed terrain at varing ref_levels.
 
+        Cut and fill for every level are looked up in the HypsometricIndex of
+        the mesh (see get_index), so any number of levels costs about the
+        same as a single one. Triangles that straddle a level are clipped
+        exactly.
+
         :param step: the increase in ref_level at each iteration
+        :param show_progress: shows the progress bar when True. Also accepts
+                              a callable receiving (done, total), a
+                              logging.Logger or a utils.Progress.
+        :param workers: (int) number of worker processes the reference levels
+                        are split across. The arrays of the index are shared
+                        with them through shared memory. Only very many
+                        levels make up for starting the processes. Default:
+                        1 (runs in the calling process).
+        :param method: (str) 'analytic' (default) or 'grid', which evaluates
+                       every level on a raster of the surface at cell_size
+                       with cumulative sums over its sorted elevations.
+        :param cell_size: (float) cell side of the 'grid' method. Default:
+                          about one cell per point of the point cloud.
+        :param return_error: (bool) adds cut_error and fill_error columns
+                             estimating the absolute error of the 'grid'
+                             method against the exact one. Default: False
         """
         z_max = self.point_cloud['z'].max()
         z_min = 0
-        levels = np.arange(z_min, z_max, step)
-
-        iterations = len(levels)-1
-        iteration = 0
-        curves = []
-
-        integrals = self.triangular_areas * 3 * 2 * iterations
-        print("Please hold while I calculate {} double integrals.".format(
-            integrals))
-
-        for ref_level in levels:
-            cut = self.get_cut_volume(ref_level, show_progress=False)
-            fill = self.get_fill_volume(ref_level, show_progress=False)
-            curves.append([ref_level, cut, fill])
-            print_progress(iteration,
-                           iterations,
-                           prefix='Progress:',
-                           suffix='Complete',
-                           length = 50)
-            iteration += 1
-
-        columns = ['ref_level', 'cut', 'fill']
-        return pd.DataFrame(data=curves, columns=columns)
+        levels = np.arange(z_min, z_max, step, dtype=np.float64)
+
+        if method == 'grid':
+            with stage('mesh.curves_grid', levels=len(levels)):
+                (_, cut, fill, errors) = self._get_grid_volumes(cell_size,
+                                                                levels)
+            get_progress(show_progress, len(levels)).set(len(levels))
+            errors = errors[1:]
+        elif method == 'analytic':
+            (cut, fill) = self._get_analytic_curves(levels,
+                                                    show_progress,
+                                                    workers)
+            errors = (np.zeros(len(levels)), np.zeros(len(levels)))
+        else:
+            raise ValueError(
+                "Unknown volume method. Expected 'analytic' or 'grid'.")
+        curves = pd.DataFrame({'ref_level': levels, 'cut': cut, 'fill': fill})
+        if return_error:
+            curves['cut_error'] = errors[0]
+            curves['fill_error'] = errors[1]
+        return curves
+
+    def _get_analytic_curves(self, levels, show_progress, workers):
+        """
+        Returns a tuple of numpy arrays (cut, fill) for the given levels out
+        of the index of the mesh, either in this process or split across
+        worker processes.
+        """
+        index = self.get_index()
+        progress = get_progress(show_progress, len(levels))
+        with stage('mesh.curves', triangles=len(index), levels=len(levels)):
+            if workers is None or workers <= 1 or len(levels) <= 1:
+                (cut, fill) = index.get_cut_fill_volumes(levels)
+                progress.set(len(levels))
+            else:
+                (cut, fill) = self._get_parallel_curves(index,
+                                                        levels,
+                                                        workers,
+                                                        progress)
+        return (cut, fill)
+
+    def _get_parallel_curves(self, index, levels, workers, progress):
+        """
+        Returns a tuple of numpy arrays (cut, fill) computed by a pool of
+        worker processes, each one handling a contiguous slice of levels.
+        """
+        cut = np.empty(len(levels))
+        fill = np.empty(len(levels))
+        slices = np.array_split(np.arange(len(levels)),
+                                min(len(levels), workers*4))
+        shared = [share_array(np.ascontiguousarray(getattr(index, name)))
+                  for name in _INDEX_ARRAYS]
+        descriptors = [descriptor for (_, descriptor) in shared]
+        scalars = [getattr(index, name) for name in _INDEX_SCALARS]
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {}
+                for indexes in slices:
+                    future = executor.submit(_get_shared_cut,
+                                             descriptors,
+                                             scalars,
+                                             levels[indexes])
+                    futures[future] = indexes
+                for future in as_completed(futures):
+                    indexes = futures[future]
+                    (cut[indexes], fill[indexes]) = (
+                        index._get_cut_fill_volumes(levels[indexes],
+                                                    future.result()))
+                    progress.update(len(indexes))
+        finally:
+            for (memory, _) in shared:
+                memory.close()
+                memory.unlink()
+        return (cut, fill)
+
+    def _get_level_evaluator(self, method, cell_size):
+        """
+        Returns a tuple (evaluate, area) where evaluate is a callable
+        receiving reference levels and returning a tuple of numpy arrays
+        (cut, fill), and area is the footprint of the surface it measures.
+        The sorted cell elevations, or the index of the mesh, are prepared
+        once, so every evaluation is a binary search.
+        """
+        if method == 'grid':
+            (heights, cell_area) = self._get_grid_heights(cell_size)
+            def evaluate(levels):
+                return get_grid_cut_fill_volumes(heights, cell_area, levels)
+            return (evaluate, len(heights)*cell_area)
+        elif method != 'analytic':
+            raise ValueError(
+                "Unknown volume method. Expected 'analytic' or 'grid'.")
+        index = self.get_index()
+        return (index.get_cut_fill_volumes, index.get_area())
+
+    def get_target_level(self,
+                         net_volume,
+                         swell_factor=1.0,
+                         tolerance=1e-6,
+                         method='analytic',
+                         cell_size=None):
+        """
+        Returns the reference level at which the cut volume, once swollen,
+        exceeds the fill volume by net_volume: swell_factor*cut - fill =
+        net_volume. A negative net_volume is material to be brought in.
+
+        The excess swell_factor*cut - fill decreases monotonically with the
+        level, so it is solved by a bracketed root search (Brent's method)
+        between the lowest and highest points, evaluating cut and fill at a
+        few levels only. Beyond those points the excess changes linearly
+        with the level, at the rate of the footprint area, which gives the
+        level in closed form. So does a swell_factor of 1.0, since cut -
+        fill is the volume minus the footprint area times the level.
+
+        :param net_volume: (float) volume left over (positive) or missing
+                           (negative) after filling, in swollen units.
+        :param swell_factor: (float) volume a unit of cut occupies once
+                             placed as fill. Above 1.0 for swelling
+                             material, below 1.0 for shrinking material.
+                             Default: 1.0
+        :param tolerance: (float) absolute tolerance on the level.
+        :param method: (str) 'analytic' (default) or 'grid'. See get_volume.
+        :param cell_size: (float) cell side of the 'grid' method.
+        """
+        if swell_factor <= 0.0:
+            raise ValueError("The swell factor must be positive.")
+        if tolerance <= 0.0:
+            raise ValueError("The tolerance must be positive.")
+        (evaluate, area) = self._get_level_evaluator(method, cell_size)
+        def get_excess(level):
+            (cut, fill) = evaluate(level)
+            return float(swell_factor*cut[0] - fill[0]) - net_volume
+
+        with stage('mesh.target_level') as solve:
+            z = self.point_cloud['z'].to_numpy(dtype=np.float64)
+            (low, high) = (float(z.min()), float(z.max()))
+            excess_low = get_excess(low)
+            if swell_factor == 1.0 or excess_low <= 0.0:
+                # cut grows by the footprint area per unit of level below
+                # the lowest point, where nothing is filled
+                return low + excess_low/(swell_factor*area)
+            excess_high = get_excess(high)
+            if excess_high >= 0.0:
+                return high + excess_high/area
+            (level, result) = brentq(get_excess, low, high,
+                                     xtol=tolerance,
+                                     full_output=True)
+            solve.count(evaluations=result.function_calls + 2)
+        return float(level)
+
+    def get_balance_level(self,
+                          swell_factor=1.0,
+                          tolerance=1e-6,
+                          method='analytic',
+                          cell_size=None):
+        """
+        Returns the reference level at which the swollen cut volume balances
+        the fill volume: swell_factor*cut = fill. See get_target_level.
+
+        :param swell_factor: (float) volume a unit of cut occupies once
+                             placed as fill. Default: 1.0
+        :param tolerance: (float) absolute tolerance on the level.
+        :param method: (str) 'analytic' (default) or 'grid'. See get_volume.
+        :param cell_size: (float) cell side of the 'grid' method.
+        """
+        return self.get_target_level(0.0,
+                                     swell_factor=swell_factor,
+                                     tolerance=tolerance,
+                                     method=method,
+                                     cell_size=cell_size)
 
     def plot_curves(self, curves):
         """
@@ -256,19 +1464,22 @@ class TriangularMesh(object):
         :param curves: (pandas DataFrame) a collection of volume curves data.
                        Expected columns: ref_level, cut, fill, swell_cut
         """
-        layout = go.Layout(title='Volume Curves',
-                           autosize=True,
-                           xaxis=dict(title='Reference level (meters)'),
-                           yaxis=dict(title='Volume (cubic meters)'))
-        def get_trace(volume, name):
-            return go.Scatter(x=curves['ref_level'],
-                              y=volume,
-                              mode='lines',
-                              name=name)
-
-        trace_cut = get_trace(curves['cut'], 'cut')
-        trace_fill = get_trace(curves['fill'], 'fill')
-
-        figure = go.Figure(data=[trace_cut, trace_fill],
-                           layout=layout)
-        return po.plot(figure, filename='volume_curves.html')
+        import plotly.graph_objs as go
+        import plotly.offline as po
+        with stage('plot.curves', levels=len(curves)):
+            layout = go.Layout(title='Volume Curves',
+                               autosize=True,
+                               xaxis=dict(title='Reference level (meters)'),
+                               yaxis=dict(title='Volume (cubic meters)'))
+            def get_trace(volume, name):
+                return go.Scatter(x=curves['ref_level'],
+                                  y=volume,
+                                  mode='lines',
+                                  name=name)
+
+            trace_cut = get_trace(curves['cut'], 'cut')
+            trace_fill = get_trace(curves['fill'], 'fill')
+
+            figure = go.Figure(data=[trace_cut, trace_fill],
+                               layout=layout)
+            return po.plot(figure, filename='volume_curves.html')
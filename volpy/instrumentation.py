@@ -0,0 +1,182 @@
+# Opt-in stage timing and profiling hooks.
+#
+# Survey, TriangularMesh and SurveyPlot wrap their main stages in
+# `with stage(name, **items):` blocks. While instrumentation is disabled,
+# stage() returns a shared no-op context manager, so the hooks cost a single
+# global lookup per stage. Enable it with:
+#
+#     from volpy import instrumentation
+#     with instrumentation.enable(callback=print) as metrics:
+#         mesh.get_volume_curves()
+#     metrics.summary()
+import threading
+import time
+import tracemalloc
+
+_instrumentation = None # the enabled Instrumentation, if any
+
+
+class _NullStage():
+    """Context manager used for every stage while instrumentation is off."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        return False
+
+    def count(self, **items):
+        pass
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage():
+    """Measures a single run of a stage."""
+
+    def __init__(self, instrumentation, name, items):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.items = items
+        self.peak = 0
+
+    def count(self, **items):
+        """Adds to the item counts (e.g. triangles=N) reported by the stage."""
+        for (item, amount) in items.items():
+            self.items[item] = self.items.get(item, 0) + amount
+
+    def __enter__(self):
+        self.instrumentation._enter(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception):
+        seconds = time.perf_counter() - self.start
+        self.instrumentation._exit(self, seconds)
+        return False
+
+
+class Instrumentation():
+    """
+    Collects per stage wall time, call counts, peak traced memory and item
+    counts (triangles processed, levels evaluated, points converted...).
+
+    :param callback: callable receiving a dict for every finished stage with
+                     stage, seconds, peak_memory (bytes or None) and items.
+    :param track_memory: (bool) records the peak memory allocated during each
+                         stage through tracemalloc, which slows down pure
+                         Python code. Default: False
+    """
+
+    def __init__(self, callback=None, track_memory=False):
+        self.callback = callback
+        self.track_memory = track_memory
+        self.metrics = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._started_tracemalloc = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        disable()
+        return False
+
+    def _enter(self, stage):
+        if not self.track_memory:
+            return
+        stack = self._get_stack()
+        if stack:
+            # Keep the parent peak before resetting it for the new stage.
+            stack[-1].peak = max(stack[-1].peak,
+                                 tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        stage.baseline = tracemalloc.get_traced_memory()[0]
+        stack.append(stage)
+
+    def _exit(self, stage, seconds):
+        peak_memory = None
+        if self.track_memory:
+            stack = self._get_stack()
+            stack.pop()
+            stage.peak = max(stage.peak, tracemalloc.get_traced_memory()[1])
+            peak_memory = max(0, stage.peak - stage.baseline)
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, stage.peak)
+            tracemalloc.reset_peak()
+
+        with self._lock:
+            metric = self.metrics.setdefault(stage.name, {'calls': 0,
+                                                          'seconds': 0.0,
+                                                          'peak_memory': None,
+                                                          'items': {}})
+            metric['calls'] += 1
+            metric['seconds'] += seconds
+            if peak_memory is not None:
+                metric['peak_memory'] = max(metric['peak_memory'] or 0,
+                                            peak_memory)
+            for (item, amount) in stage.items.items():
+                metric['items'][item] = metric['items'].get(item, 0) + amount
+        if self.callback is not None:
+            self.callback({'stage': stage.name,
+                           'seconds': seconds,
+                           'peak_memory': peak_memory,
+                           'items': dict(stage.items)})
+
+    def _get_stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def summary(self):
+        """Returns a printable table with the collected metrics."""
+        lines = ['{:<24} {:>7} {:>11} {:>12}  {}'.format(
+            'stage', 'calls', 'seconds', 'peak memory', 'items')]
+        for (name, metric) in sorted(self.metrics.items()):
+            peak = metric['peak_memory']
+            lines.append('{:<24} {:>7} {:>11.4f} {:>12}  {}'.format(
+                name,
+                metric['calls'],
+                metric['seconds'],
+                '-' if peak is None else '{:.1f}MB'.format(peak/2**20),
+                ', '.join('{}={}'.format(item, amount)
+                          for (item, amount) in metric['items'].items())))
+        return '\n'.join(lines)
+
+
+def enable(callback=None, track_memory=False):
+    """
+    Enables instrumentation and returns the Instrumentation collecting the
+    metrics. It can be used as a context manager that disables it on exit.
+    See Instrumentation for the arguments.
+    """
+    global _instrumentation
+    disable()
+    instrumentation = Instrumentation(callback, track_memory)
+    if track_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        instrumentation._started_tracemalloc = True
+    _instrumentation = instrumentation
+    return instrumentation
+
+def disable():
+    """Disables instrumentation."""
+    global _instrumentation
+    instrumentation = _instrumentation
+    _instrumentation = None
+    if instrumentation is not None and instrumentation._started_tracemalloc:
+        tracemalloc.stop()
+        instrumentation._started_tracemalloc = False
+
+def stage(name, **items):
+    """
+    Returns a context manager that measures the stage name when
+    instrumentation is enabled and does nothing otherwise.
+
+    :param name: (str) stage name, e.g. 'mesh.triangulate'.
+    :param items: initial item counts, e.g. triangles=N.
+    """
+    if _instrumentation is None:
+        return _NULL_STAGE
+    return _Stage(_instrumentation, name, items)
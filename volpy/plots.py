@@ -1,13 +1,10 @@
 import numpy as np
-from sympy import symbols
-import plotly
 import plotly.offline as po
 import plotly.graph_objs as go
-from plotly import tools
+from plotly.subplots import make_subplots
 
 from .geometry import TriangularMesh
-from .coordinates import CartesianCoordinate
-from .geometry import Triangle
+from .instrumentation import stage
 
 
 class SurveyPlot():
@@ -26,34 +23,36 @@ class SurveyPlot():
         """
         Plots an interactive 3D view of the surveyed terrain.
         """
-        layout = go.Layout(title='Terrain Point Cloud', autosize=True)
-        trace = go.Scatter3d(x=self.survey.data.x,
-                             y=self.survey.data.y,
-                             z=self.survey.data.z,
-                             mode='markers',
-                             marker=dict(size=4,
-                                         line=dict(color='#fff3ff',
-                                                   width=0.5),
-                                         opacity=0.8),
-                             connectgaps=False,
-                             name='Terrain Point Cloud')
-
-        figure = go.Figure(data=[trace], layout=layout)
-        return po.plot(figure, filename='3d_view.html')
+        with stage('plot.scatter3d', points=len(self.survey.data)):
+            layout = go.Layout(title='Terrain Point Cloud', autosize=True)
+            trace = go.Scatter3d(x=self.survey.data.x,
+                                 y=self.survey.data.y,
+                                 z=self.survey.data.z,
+                                 mode='markers',
+                                 marker=dict(size=4,
+                                             line=dict(color='#fff3ff',
+                                                       width=0.5),
+                                             opacity=0.8),
+                                 connectgaps=False,
+                                 name='Terrain Point Cloud')
+
+            figure = go.Figure(data=[trace], layout=layout)
+            return po.plot(figure, filename='3d_view.html')
 
     def contour(self):
         """
         Plots a contour of the surveyed terrain.
         """
-        layout = go.Layout(title='Terrain Contour',
-                           autosize=True,
-                           xaxis=dict(title='x position (meters)'),
-                           yaxis=dict(title='y position (meters)'))
-        trace = go.Contour(x=self.survey.data.x,
-                           y=self.survey.data.y,
-                           z=self.survey.data.z)
-        figure = go.Figure(data=[trace], layout=layout)
-        return po.plot(figure, filename='Contour.html')
+        with stage('plot.contour', points=len(self.survey.data)):
+            layout = go.Layout(title='Terrain Contour',
+                               autosize=True,
+                               xaxis=dict(title='x position (meters)'),
+                               yaxis=dict(title='y position (meters)'))
+            trace = go.Contour(x=self.survey.data.x,
+                               y=self.survey.data.y,
+                               z=self.survey.data.z)
+            figure = go.Figure(data=[trace], layout=layout)
+            return po.plot(figure, filename='Contour.html')
 
     def scatter(self, x, y, name):
         return go.Scatter(
@@ -80,68 +79,80 @@ class SurveyPlot():
         Plots a sequence of terrain profiles and histogram of points collected
         grouped by elevation.
         """
-        figure = tools.make_subplots(rows=2,
-                                     cols=2,
-                                     subplot_titles=('Survey points collected',
-                                                     'Top View: XY',
-                                                     'Elevation(m): XZ',
-                                                     'Elevation(m): YZ'))
-        figure['layout'].update(title='Terrain Profile')
-        trace_histogram = self.histogram(
-            self.survey.data.z, 'Elevation Histogram')
-        trace_top = self.scatter(self.survey.data.x,
-                                 self.survey.data.y,
-                                 'Top View')
-        trace_xz = self.scatter(self.survey.data.x,
-                                self.survey.data.z,
-                                'XZ')
-        trace_yz = self.scatter(self.survey.data.y,
-                                self.survey.data.z,
-                                'YZ')
-        figure.append_trace(trace_histogram, 1, 1)
-        figure.append_trace(trace_top, 1, 2)
-        figure.append_trace(trace_xz, 2, 1)
-        figure.append_trace(trace_yz, 2, 2)
-        return po.plot(figure, filename='profile.html')
-
-    def mesh_plot(self):
-        """Plots a top view of the triangular mesh for the survey"""
-
-        # Adjust for 3 different colors
-        colors = {1: 'red',
-                  2: 'yellow',
-                  3: 'blue',
-                  4: 'green'}
-        current_color = 1
-
-        triangular_mesh = TriangularMesh(self.survey.data)
-        data_amount = len(triangular_mesh.data)
-        data = []
-        for i in range(data_amount):
-            A = triangular_mesh.point_cloud.iloc[triangular_mesh.data[i][0]]
-            B = triangular_mesh.point_cloud.iloc[triangular_mesh.data[i][1]]
-            C = triangular_mesh.point_cloud.iloc[triangular_mesh.data[i][2]]
-            trace = go.Scatter(
-                x=[A['x'], B['x'], C['x']],
-                y=[A['y'], B['y'], C['y']],
-                mode='markers',
-                marker=dict(
-                    size=4,
-                    opacity=0.3,
-                    color=colors[current_color]),
-                connectgaps=False,
-                fill='toself',
-                showlegend=False,
-                name='Terrain Mesh')
-            data.append(trace)
+        with stage('plot.profile', points=len(self.survey.data)):
+            figure = make_subplots(rows=2,
+                                   cols=2,
+                                   subplot_titles=('Survey points collected',
+                                                   'Top View: XY',
+                                                   'Elevation(m): XZ',
+                                                   'Elevation(m): YZ'))
+            figure['layout'].update(title='Terrain Profile')
+            trace_histogram = self.histogram(
+                self.survey.data.z, 'Elevation Histogram')
+            trace_top = self.scatter(self.survey.data.x,
+                                     self.survey.data.y,
+                                     'Top View')
+            trace_xz = self.scatter(self.survey.data.x,
+                                    self.survey.data.z,
+                                    'XZ')
+            trace_yz = self.scatter(self.survey.data.y,
+                                    self.survey.data.z,
+                                    'YZ')
+            figure.append_trace(trace_histogram, 1, 1)
+            figure.append_trace(trace_top, 1, 2)
+            figure.append_trace(trace_xz, 2, 1)
+            figure.append_trace(trace_yz, 2, 2)
+            return po.plot(figure, filename='profile.html')
+
+    def mesh_trace(self, mesh=None, webgl=True):
+        """
+        Returns a single trace with the top view of the edges of a triangular
+        mesh: one path through every edge, with a gap between edges, built
+        from the simplices in array operations. Edges shared by two triangles
+        are drawn once.
 
-            # Color control
-            current_color += 1
-            if (current_color > 4):
-                current_color = 1
+        Arguments:
+        mesh: the TriangularMesh of the survey. Default: None (triangulates
+              the survey data).
+        webgl: renders the trace with WebGL (go.Scattergl), which keeps large
+               meshes responsive in the browser. Default: True
+        """
+        if mesh is None:
+            mesh = TriangularMesh(self.survey.data)
+        (simplices, _) = mesh._get_topology(mesh.point_cloud)
+        edges = np.sort(np.concatenate((simplices[:, [0, 1]],
+                                        simplices[:, [1, 2]],
+                                        simplices[:, [2, 0]])), axis=1)
+        edges = np.unique(edges, axis=0)
+        path = []
+        for column in ['x', 'y']:
+            values = mesh.point_cloud[column].to_numpy(dtype=np.float64)
+            segments = np.full((len(edges), 3), np.nan)
+            segments[:, :2] = values[edges]
+            path.append(segments.ravel())
+        scatter = go.Scattergl if webgl else go.Scatter
+        return scatter(x=path[0],
+                       y=path[1],
+                       mode='lines',
+                       line=dict(width=1, color='blue'),
+                       connectgaps=False,
+                       showlegend=False,
+                       name='Terrain Mesh')
+
+    def mesh_plot(self, mesh=None, webgl=True):
+        """
+        Plots a top view of the triangular mesh for the survey as a single
+        trace, so the size of the plot grows linearly with the number of
+        triangles. See mesh_trace.
 
-        figure = go.Figure(data=data)
-        figure['layout'].update(title='Top Terrain Mesh View',
-                                xaxis=dict(title='x position (meters)'),
-                                yaxis=dict(title='y position (meters)'))
-        return po.plot(figure, filename='mesh.html')
+        Arguments:
+        mesh: the TriangularMesh of the survey, reused instead of
+              triangulating the survey data again. Default: None
+        webgl: renders the mesh with WebGL. Default: True
+        """
+        with stage('plot.mesh', points=len(self.survey.data)):
+            figure = go.Figure(data=[self.mesh_trace(mesh, webgl)])
+            figure['layout'].update(title='Top Terrain Mesh View',
+                                    xaxis=dict(title='x position (meters)'),
+                                    yaxis=dict(title='y position (meters)'))
+            return po.plot(figure, filename='mesh.html')
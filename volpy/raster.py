@@ -0,0 +1,123 @@
+# Regular elevation grids (DEM) sampled from a triangular mesh.
+import json
+import os
+import numpy as np
+
+RASTER_VERSION = 1
+
+class Raster():
+    """
+    A regular grid of elevations. Row 0 is the northernmost row and column 0
+    the westernmost column, so cell (i, j) is centered at
+    x = origin[0] + (j + 0.5)*cell_size, y = origin[1] - (i + 0.5)*cell_size.
+    """
+
+    def __init__(self,
+                 elevation,
+                 origin,
+                 cell_size,
+                 offset=None,
+                 utm_zone=None,
+                 fill_value=np.nan):
+        """
+        :param elevation: (2D numpy array) z at the center of every cell.
+        :param origin: tuple (x, y) of the upper left corner of the grid, in
+                       the coordinates of the mesh point cloud.
+        :param cell_size: (float) side of the square cells.
+        :param offset: tuple (x, y, z) that was subtracted from the source
+                       coordinates (Survey.offset). Adding it to origin and
+                       elevation returns source coordinates. Default: None
+        :param utm_zone: tuple (zone_number, zone_letter) of the source
+                         coordinates (Survey.utm_zone). Default: None
+        :param fill_value: (float) elevation of cells outside the mesh.
+        """
+        self.elevation = elevation
+        self.origin = (float(origin[0]), float(origin[1]))
+        self.cell_size = float(cell_size)
+        self.offset = None if offset is None else tuple(
+            float(value) for value in offset)
+        self.utm_zone = None if utm_zone is None else tuple(utm_zone)
+        self.fill_value = float(fill_value)
+
+    @property
+    def shape(self):
+        return self.elevation.shape
+
+    def get_x(self):
+        """Returns the x coordinate of the center of every column."""
+        columns = np.arange(self.shape[1], dtype=np.float64)
+        return self.origin[0] + (columns + 0.5)*self.cell_size
+
+    def get_y(self):
+        """Returns the y coordinate of the center of every row."""
+        rows = np.arange(self.shape[0], dtype=np.float64)
+        return self.origin[1] - (rows + 0.5)*self.cell_size
+
+    def get_metadata(self):
+        """Returns the JSON serializable georeferencing metadata."""
+        return {'version': RASTER_VERSION,
+                'shape': list(self.shape),
+                'dtype': self.elevation.dtype.str,
+                'origin': list(self.origin),
+                'cell_size': self.cell_size,
+                'offset': None if self.offset is None else list(self.offset),
+                'utm_zone': None if self.utm_zone is None else list(
+                    self.utm_zone),
+                # NaN is not valid JSON
+                'fill_value': (None if np.isnan(self.fill_value)
+                               else self.fill_value)}
+
+    def save(self, path):
+        """
+        Stores the raster in the directory path as a memory-mappable
+        elevation.npy array and a raster.json file with the metadata.
+
+        :param path: (str) directory of the raster. Created when missing.
+        """
+        os.makedirs(path, exist_ok=True)
+        elevation_path = os.path.join(path, 'elevation.npy')
+        if not (isinstance(self.elevation, np.memmap) and
+                os.path.abspath(self.elevation.filename) ==
+                os.path.abspath(elevation_path)):
+            np.save(elevation_path, self.elevation)
+        else:
+            self.elevation.flush()
+        with open(os.path.join(path, 'raster.json'), 'w') as metadata_file:
+            json.dump(self.get_metadata(), metadata_file)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """
+        Returns a Raster stored by save, with its elevation memory mapped.
+
+        :param path: (str) directory of the raster.
+        :param mmap_mode: numpy memory map mode, or None to read it in memory.
+        """
+        with open(os.path.join(path, 'raster.json'), 'r') as metadata_file:
+            metadata = json.load(metadata_file)
+        if metadata.get('version') != RASTER_VERSION:
+            raise ValueError("Unsupported raster version.")
+        elevation = np.load(os.path.join(path, 'elevation.npy'),
+                            mmap_mode=mmap_mode)
+        fill_value = metadata['fill_value']
+        return cls(elevation,
+                   metadata['origin'],
+                   metadata['cell_size'],
+                   offset=metadata['offset'],
+                   utm_zone=metadata['utm_zone'],
+                   fill_value=np.nan if fill_value is None else fill_value)
+
+    @classmethod
+    def create(cls, path, shape, dtype, origin, cell_size, **kwargs):
+        """
+        Returns a Raster whose elevation is a writable memory map of a new
+        elevation.npy file in the directory path, so grids larger than the
+        memory can be written tile by tile. Call save once it is filled.
+        """
+        from numpy.lib.format import open_memmap
+        os.makedirs(path, exist_ok=True)
+        elevation = open_memmap(os.path.join(path, 'elevation.npy'),
+                                mode='w+',
+                                dtype=dtype,
+                                shape=shape)
+        return cls(elevation, origin, cell_size, **kwargs)
@@ -1,8 +1,13 @@
+import numpy as np
 import pandas as pd
 import os
-from defusedxml.ElementTree import parse
+from defusedxml.ElementTree import iterparse
+from . import cache
 from .coordinates import CoordinateSystem
 from .coordinates import UtmCoordinate
+from .instrumentation import stage
+
+GPX_CHUNK_SIZE = 65536 # trackpoints converted to floats at a time
 
 
 class Survey():
@@ -16,7 +21,10 @@ class Survey():
         self,
         source,
         name='Survey',
-        coordinate_system=CoordinateSystem.CARTESIAN):
+        coordinate_system=CoordinateSystem.CARTESIAN,
+        chunksize=None,
+        cache_dir=None,
+        cache_by_content=False):
         """Initializes a survey object
 
         :param source: path to the file that contains the survey data.
@@ -26,10 +34,25 @@ class Survey():
         :param coordinate_system: an enumeration based on available coordinate
                                   systems at the coordinates module.
                                   Default: CoordinateSystem.CARTESIAN
+        :param chunksize: number of rows read at a time from .txt and .csv
+                          sources (int). Keeps peak memory bounded on very
+                          large surveys. Default: None (single read).
+        :param cache_dir: directory of an on-disk binary cache of the parsed
+                          survey (str). Later loads of an unchanged source
+                          memory map the cached arrays instead of parsing it.
+                          Default: None (no cache).
+        :param cache_by_content: identifies an unchanged source by a hash of
+                                 its contents instead of its modification
+                                 time (bool). Default: False
 
         :attr data: pandas DataFrame containing x, y, z, elevation as columns.
                     internally set according to the available source file and
                     CoordinateSystem.
+        :attr utm_zone: tuple (zone_number, zone_letter) every point was
+                        projected into when converting from geographic
+                        coordinates. None otherwise.
+        :attr offset: tuple (x, y, z) subtracted from the source coordinates
+                      to generate the x, y, z columns of data.
         """
 
         # Validate if extension is supported.
@@ -44,9 +67,27 @@ class Survey():
         self.name = name
         self.source = source
         self.coordinate_system = coordinate_system
+        self.chunksize = chunksize
+        self.utm_zone = None
+        self.offset = None
+
+        if cache_dir is not None:
+            key = cache.get_survey_key(source,
+                                       coordinate_system,
+                                       cache_by_content)
+            with stage('survey.cache_load'):
+                cached = cache.load_survey(cache_dir, source, key)
+            if cached is not None:
+                (self.data, metadata) = cached
+                self.offset = tuple(metadata['offset'])
+                if metadata['utm_zone'] is not None:
+                    self.utm_zone = tuple(metadata['utm_zone'])
+                return
 
         if extension == '.gpx':
-            self.data = self._read_gpx()
+            with stage('survey.read_gpx') as read:
+                self.data = self._read_gpx()
+                read.count(points=len(self.data))
         elif (extension == '.csv') or (extension == '.txt'):
             expected_col_names = {
                 CoordinateSystem.GEOGRAPHIC: ['latitude',
@@ -59,11 +100,22 @@ class Survey():
                                              'y',
                                              'z',]
             }
-            self.data = self._read_txt(
-                expected_col_names[self.coordinate_system])
+            with stage('survey.read_txt') as read:
+                self.data = self._read_txt(
+                    expected_col_names[self.coordinate_system])
+                read.count(points=len(self.data))
         else:
             raise ValueError("Error while parsing supported file extension.")
 
+        if cache_dir is not None:
+            with stage('survey.cache_save'):
+                cache.save_survey(cache_dir,
+                                  source,
+                                  key,
+                                  self.data,
+                                  offset=self.offset,
+                                  utm_zone=self.utm_zone)
+
     def get_bounds(self):
         """
         Returns a tuple with the maximum values for x, y, z available on the
@@ -75,6 +127,56 @@ class Survey():
         print("x={}; y={}; z={}".format(x_max, y_max, z_max))
         return (x_max, y_max, z_max)
 
+    def get_data(self, offset=None):
+        """
+        Returns a copy of data whose x, y, z columns are relative to offset
+        instead of the offset of this survey, so the points of surveys of the
+        same site can be merged (e.g. with TriangularMesh.add_points).
+
+        :param offset: tuple (x, y, z) subtracted from the source coordinates,
+                       usually the offset attribute of another Survey.
+                       Default: the offset of this survey.
+        """
+        data = self.data.copy()
+        if offset is None:
+            return data
+        for (column, own, other) in zip(['x', 'y', 'z'], self.offset, offset):
+            data[column] = data[column] + (own - float(other))
+        return data
+
+    def _get_utm(self, latitudes, longitudes, elevations):
+        """
+        Returns an UtmCoordinate holding arrays out of geographic coordinate
+        arrays. All points are converted at once and projected into a single
+        UTM zone chosen for the survey on its first call, which is stored in
+        the utm_zone attribute and forced on every following call.
+        """
+        (zone_number, zone_letter) = self.utm_zone or (None, None)
+        with stage('survey.utm', points=len(latitudes)):
+            utm = UtmCoordinate.create_from_geographic_array(latitudes,
+                                                             longitudes,
+                                                             elevations,
+                                                             zone_number,
+                                                             zone_letter)
+        self.utm_zone = (utm.zone_number, utm.zone_letter)
+        return utm
+
+    def _generate_output(self, x, y, elevation, offset):
+        """
+        Returns a pandas DataFrame containing x, y, z, elevation columns and
+        sets the offset attribute.
+
+        Arguments:
+        x, y, elevation: numpy arrays with the source coordinates.
+        offset: tuple (x, y, z) to subtract from x, y and elevation.
+        """
+        self.offset = tuple(float(value) for value in offset)
+        data = pd.DataFrame({'x': x - self.offset[0],
+                             'y': y - self.offset[1],
+                             'z': elevation - self.offset[2],
+                             'elevation': elevation})
+        return data
+
     def _read_gpx(self):
         """Parses an xml file containing GPS data
         Data points are assumed to be in a Geographic coordinate system
@@ -83,61 +185,68 @@ class Survey():
         successful and None otherwise.
         """
 
-        # Parsing XML file
-        elements = parse(self.source)
+        # Stream the XML file. Each trackpoint is dropped from the tree once
+        # read and its raw strings are converted in bulk one chunk at a time.
+        chunks = []
         points = []
-        for element in elements.iter():
+        parents = []
+        for (event, element) in iterparse(self.source,
+                                          events=('start', 'end')):
+            if event == 'start':
+                parents.append(element)
+                continue
+            parents.pop()
             if element.tag.find("trkpt") == -1:
                 continue
 
             latitude = element.attrib.get("lat", None)
             longitude = element.attrib.get("lon", None)
-            elevation = element[0].text
+            elevation = element[0].text if len(element) > 0 else None
 
             if (not latitude or
                 not longitude or
                 not elevation):
                 raise ValueError("Unexpected tag for lat/lon/ele.")
 
-            try:
-                latitude = pd.to_numeric(latitude)
-                longitude = pd.to_numeric(longitude)
-                elevation = pd.to_numeric(elevation)
-                utm = UtmCoordinate.create_from_geographic(
-                    latitude,
-                    longitude,
-                    elevation)
-                entry = (latitude,
-                        longitude,
-                        utm.elevation,
-                        utm.northing,
-                        utm.easting)
-                points.append(entry)
-            except Exception as exception:
-                raise exception
-
-        if len(points) == 0:
+            points.append((latitude, longitude, elevation))
+            element.clear()
+            if parents:
+                parents[-1].remove(element)
+            if len(points) == GPX_CHUNK_SIZE:
+                chunks.append(np.array(points, dtype=np.float64))
+                points = []
+        if len(points) > 0:
+            chunks.append(np.array(points, dtype=np.float64))
+
+        if len(chunks) == 0:
             raise(ValueError("Unable to find valid points within the provided GPX file."))
 
         # Generate DataFrame
         columns = ['latitude',
                    'longitude',
-                   'elevation',
-                   'northing',
-                   'easting']
-        data = pd.DataFrame.from_records(points,
-                                         columns=columns)
+                   'elevation']
+        data = pd.DataFrame(np.concatenate(chunks),
+                            columns=columns)
+        utm = self._get_utm(data['latitude'].to_numpy(),
+                            data['longitude'].to_numpy(),
+                            data['elevation'].to_numpy())
+        data['northing'] = utm.northing
+        data['easting'] = utm.easting
 
         # Generate x, y, z
-        data['x'] = data['easting'] - data['easting'].min()
-        data['y'] = data['northing'] - data['northing'].min()
-        data['z'] = data['elevation'] - data['elevation'].min()
-        selection = ['x', 'y', 'z', 'elevation']
-        return data[selection]
+        return self._generate_output(data['easting'].to_numpy(),
+                                     data['northing'].to_numpy(),
+                                     data['elevation'].to_numpy(),
+                                     (data['easting'].min(),
+                                      data['northing'].min(),
+                                      data['elevation'].min()))
 
     def _read_txt(self, expected_col_names):
         """
-        Reads data in txt or csv formats
+        Reads data in txt or csv formats. Only the expected columns are parsed,
+        directly as floats, and the source is read in chunks when a chunksize
+        is set. The minima used to normalize x, y, z are computed as each chunk
+        is read.
 
         Arguments:
         expected_col_names: an array containing the names of the expected column
@@ -147,53 +256,58 @@ class Survey():
         """
 
         try:
-            # Read data
-            data = pd.read_csv(self.source)
-
-            # Check number of columns
-            if data.shape[1] != len(expected_col_names):
+            # Check header
+            header = pd.read_csv(self.source, nrows=0)
+            if header.shape[1] != len(expected_col_names):
                     raise ValueError(
                         "Unexpected number of columns. Expected {}.".format(
                             len(expected_col_names)))
-            # Check column names
-            for item in data.columns:
+            for item in header.columns:
                 if item not in expected_col_names:
                     raise ValueError("Unexpected column name. Expected:{}"\
                         .format(expected_col_names))
 
-            # Convert data
-            for column in data.columns:
-                data[column] = pd.to_numeric(data[column])
-
-            # Generate output
-            if self.coordinate_system == CoordinateSystem.GEOGRAPHIC:
-                def generate_utm(row):
-                    return UtmCoordinate.create_from_geographic(
-                        row['latitude'],
-                        row['longitude'],
-                        row['elevation'])
-                data['UTM'] = data.apply(generate_utm, axis=1)
-                data['easting'] = data.apply(lambda row: row['UTM'].easting,
-                                             axis=1)
-                data['northing'] = data.apply(lambda row: row['UTM'].northing,
-                                              axis=1)
-                data['x'] = data['easting'] - data['easting'].min()
-                data['y'] = data['northing'] - data['northing'].min()
-                data['z'] = data['elevation'] - data['elevation'].min()
-
-            elif self.coordinate_system == CoordinateSystem.UTM:
-                data['x'] = data['easting'] - data['easting'].min()
-                data['y'] = data['northing'] - data['northing'].min()
-                data['z'] = data['elevation'] - data['elevation'].min()
-
-            elif self.coordinate_system == CoordinateSystem.CARTESIAN:
-                data['elevation'] = data['z'] # keeping return values consitent
-                data['z'] = data['elevation'] - data['elevation'].min()
-
-            else:
-                raise ValueError('Unknown coordinate system.')
-
-            selection = ['x', 'y', 'z', 'elevation']
-            return data[selection]
+            # Read data
+            reader = pd.read_csv(self.source,
+                                 usecols=expected_col_names,
+                                 dtype=np.float64,
+                                 chunksize=self.chunksize)
+            if self.chunksize is None:
+                reader = [reader]
+
+            chunks = []
+            minima = np.full(3, np.inf)
+            for data in reader:
+                # Generate (x, y, elevation) in the source units
+                if self.coordinate_system == CoordinateSystem.GEOGRAPHIC:
+                    utm = self._get_utm(data['latitude'].to_numpy(),
+                                        data['longitude'].to_numpy(),
+                                        data['elevation'].to_numpy())
+                    chunk = np.column_stack((utm.easting,
+                                             utm.northing,
+                                             utm.elevation))
+
+                elif self.coordinate_system == CoordinateSystem.UTM:
+                    chunk = data[['easting',
+                                  'northing',
+                                  'elevation']].to_numpy()
+
+                elif self.coordinate_system == CoordinateSystem.CARTESIAN:
+                    chunk = data[['x', 'y', 'z']].to_numpy()
+
+                else:
+                    raise ValueError('Unknown coordinate system.')
+
+                if len(chunk) > 0:
+                    minima = np.minimum(minima, chunk.min(axis=0))
+                chunks.append(chunk)
+
+            points = np.concatenate(chunks)
+            if self.coordinate_system == CoordinateSystem.CARTESIAN:
+                minima[0:2] = 0.0 # x, y are kept as they are
+            return self._generate_output(points[:, 0],
+                                         points[:, 1],
+                                         points[:, 2],
+                                         minima)
         except Exception as exception:
             raise exception
@@ -0,0 +1,436 @@
+# Tiled Delaunay triangulation for point clouds too large for one Delaunay.
+#
+# The x, y extent is split into square tiles. Each tile is triangulated on
+# its own points, the points within a margin around it and the vertices of
+# the convex hull of the cloud, so that its triangulation covers the whole
+# hull. It keeps the triangles whose centroid lies in the tile. A kept
+# triangle belongs to the Delaunay triangulation of the whole cloud when its
+# circumcircle is empty of every point of the cloud. That holds when the
+# circle fits in the margin, and is checked against the points of the
+# neighbouring tiles otherwise: the points found in the circle are added to
+# the tile, which is triangulated again until every triangle is certified.
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.spatial import ConvexHull, Delaunay, QhullError
+
+from .geometry import TriangularMesh, _get_spatial_order, _interpolate
+from .geometry import _get_changed_simplices, _get_circumcircles
+from .geometry import get_projected_areas
+from .instrumentation import stage
+from .utils import attach_array, share_array
+
+class TileGrid():
+    """A regular grid of square tiles covering the bounds of a point cloud."""
+
+    def __init__(self, bounds, tile_size):
+        """
+        :param bounds: tuple (x_min, y_min, x_max, y_max) of the point cloud.
+        :param tile_size: (float) side of the tiles.
+        """
+        (self.x_min, self.y_min, self.x_max, self.y_max) = [
+            float(value) for value in bounds]
+        self.tile_size = float(tile_size)
+        self.columns = max(1, int(np.ceil(
+            (self.x_max - self.x_min)/self.tile_size)))
+        self.rows = max(1, int(np.ceil(
+            (self.y_max - self.y_min)/self.tile_size)))
+
+    def __len__(self):
+        return self.rows*self.columns
+
+    def get_tile(self, x, y):
+        """Returns the index of the tile of each point (x, y)."""
+        column = np.clip(np.floor((x - self.x_min)/self.tile_size),
+                         0, self.columns - 1).astype(np.int64)
+        row = np.clip(np.floor((y - self.y_min)/self.tile_size),
+                      0, self.rows - 1).astype(np.int64)
+        return row*self.columns + column
+
+    def get_bounds(self, tile):
+        """Returns a tuple (x_min, y_min, x_max, y_max) of a tile."""
+        (row, column) = divmod(int(tile), self.columns)
+        x_min = self.x_min + column*self.tile_size
+        y_min = self.y_min + row*self.tile_size
+        return (x_min, y_min, x_min + self.tile_size, y_min + self.tile_size)
+
+    def get_tiles(self, bounds):
+        """Returns the indexes of the tiles that intersect bounds."""
+        (x_min, y_min, x_max, y_max) = bounds
+        columns = np.arange(
+            max(0, int(np.floor((x_min - self.x_min)/self.tile_size))),
+            min(self.columns,
+                int(np.floor((x_max - self.x_min)/self.tile_size)) + 1))
+        rows = np.arange(
+            max(0, int(np.floor((y_min - self.y_min)/self.tile_size))),
+            min(self.rows,
+                int(np.floor((y_max - self.y_min)/self.tile_size)) + 1))
+        return (rows[:, np.newaxis]*self.columns + columns).ravel()
+
+def _get_points(order, offsets, tiles):
+    """Returns the indexes of the points of the given tiles."""
+    return np.concatenate([order[offsets[tile]:offsets[tile + 1]]
+                           for tile in tiles] + [np.empty(0, np.int64)])
+
+def _get_region(x, y, order, offsets, grid, bounds):
+    """Returns the indexes of the points within bounds."""
+    indexes = _get_points(order, offsets, grid.get_tiles(bounds))
+    (x_min, y_min, x_max, y_max) = bounds
+    inside = ((x[indexes] >= x_min) & (x[indexes] <= x_max) &
+              (y[indexes] >= y_min) & (y[indexes] <= y_max))
+    return indexes[inside]
+
+def _get_tile_outline(x, y, order, offsets, tile):
+    """
+    Returns a tuple (outline, bounds) with the indexes of the convex hull
+    vertices of the points of a tile (all of them when there are too few for
+    a hull) and their bounding box, None for an empty tile.
+    """
+    indexes = order[offsets[tile]:offsets[tile + 1]]
+    if len(indexes) == 0:
+        return (indexes.copy(), None)
+    points = np.column_stack((x[indexes], y[indexes]))
+    bounds = np.concatenate((points.min(axis=0), points.max(axis=0)))
+    try:
+        indexes = indexes[ConvexHull(points).vertices]
+    except (QhullError, ValueError):
+        indexes = indexes.copy() # collinear or too few points: keep them all
+    return (indexes, bounds)
+
+def _get_tile_points(x, y, order, offsets, grid, hull, tile, margin):
+    """
+    Returns a tuple (region, indexes) with the bounds of a tile grown by
+    margin and the sorted indexes of the points triangulated first: the
+    points within region and the vertices of the convex hull of the cloud.
+    """
+    core = grid.get_bounds(tile)
+    region = (core[0] - margin, core[1] - margin,
+              core[2] + margin, core[3] + margin)
+    indexes = np.union1d(_get_region(x, y, order, offsets, grid, region),
+                         hull)
+    return (region, indexes)
+
+def _get_intersecting(x, y, bounds):
+    """
+    Returns a boolean array telling which triangles, whose vertices
+    coordinates are the Nx3 arrays x and y, intersect the rectangle bounds
+    (x_min, y_min, x_max, y_max). A triangle misses the rectangle when their
+    bounding boxes do not overlap or when the rectangle lies entirely outside
+    one of the triangle edges.
+    """
+    (x_min, y_min, x_max, y_max) = bounds
+    intersecting = ((x.min(axis=1) <= x_max) & (x.max(axis=1) >= x_min) &
+                    (y.min(axis=1) <= y_max) & (y.max(axis=1) >= y_min))
+    # orientation of each triangle, so that the inside of every edge is the
+    # side of the opposite vertex
+    orientation = np.sign((x[:, 1] - x[:, 0])*(y[:, 2] - y[:, 0]) -
+                          (y[:, 1] - y[:, 0])*(x[:, 2] - x[:, 0]))
+    for (i, j) in [(0, 1), (1, 2), (2, 0)]:
+        (dx, dy) = (x[:, j] - x[:, i], y[:, j] - y[:, i])
+        inside = np.zeros(len(x), dtype=bool)
+        for (corner_x, corner_y) in [(x_min, y_min), (x_max, y_min),
+                                     (x_max, y_max), (x_min, y_max)]:
+            cross = dx*(corner_y - y[:, i]) - dy*(corner_x - x[:, i])
+            inside |= orientation*cross >= 0.0
+        intersecting &= inside
+    return intersecting
+
+def _get_encroaching(x, y, order, offsets, tile_bounds, grid, region,
+                     circle):
+    """
+    Returns the indexes of the points outside region (the rectangle whose
+    points were triangulated) that lie inside a circle (center_x, center_y,
+    radius). Points on the circle do not count.
+    """
+    (center_x, center_y, radius) = circle
+    box = (center_x - radius, center_y - radius,
+           center_x + radius, center_y + radius)
+    tiles = grid.get_tiles(box)
+    # distance from the center to the bounding box of the points of a tile
+    bounds = tile_bounds[tiles]
+    with np.errstate(invalid='ignore'):
+        dx = np.maximum(np.maximum(bounds[:, 0] - center_x, 0.0),
+                        center_x - bounds[:, 2])
+        dy = np.maximum(np.maximum(bounds[:, 1] - center_y, 0.0),
+                        center_y - bounds[:, 3])
+        tiles = tiles[dx*dx + dy*dy < radius*radius] # empty tiles are NaN
+    indexes = _get_points(order, offsets, tiles)
+    (px, py) = (x[indexes], y[indexes])
+    outside = ((px < region[0]) | (px > region[2]) |
+               (py < region[1]) | (py > region[3]))
+    distance = (px - center_x)**2 + (py - center_y)**2
+    return indexes[outside & (distance < radius*radius*(1.0 - 1e-12))]
+
+def _triangulate_tile(x, y, order, offsets, tile_bounds, grid, hull, tile,
+                      margin):
+    """
+    Returns a tuple (simplices, areas, extra) with the triangles of the
+    Delaunay triangulation of the whole cloud whose centroid lies in tile,
+    their projected areas and the indexes of the points beyond the margin
+    that were inserted to certify them.
+
+    :param tile_bounds: (numpy array) bounding box of the points of every
+                        tile, NaN for empty tiles.
+    :param hull: (numpy array) indexes of the convex hull vertices.
+    """
+    core = grid.get_bounds(tile)
+    (region, indexes) = _get_tile_points(x, y, order, offsets, grid, hull,
+                                         tile, margin)
+    scale = grid.tile_size*1e-9
+    # Sides of the region beyond the cloud bounds hold no points.
+    limits = [-np.inf if region[0] <= grid.x_min else region[0] + scale,
+              -np.inf if region[1] <= grid.y_min else region[1] + scale,
+              np.inf if region[2] >= grid.x_max else region[2] - scale,
+              np.inf if region[3] >= grid.y_max else region[3] - scale]
+    extra = np.empty(0, np.int64)
+    delaunay = Delaunay(np.column_stack((x[indexes], y[indexes])),
+                        incremental=True)
+    while True:
+        simplices = delaunay.simplices
+        (tx, ty) = (x[indexes[simplices]], y[indexes[simplices]])
+        # Every triangle that may contain a point of the tile is checked.
+        touches = _get_intersecting(tx, ty, (core[0] - scale,
+                                             core[1] - scale,
+                                             core[2] + scale,
+                                             core[3] + scale))
+        (center_x, center_y, radius) = _get_circumcircles(tx, ty)
+        with np.errstate(invalid='ignore'):
+            certified = ((center_x - radius >= limits[0]) &
+                         (center_y - radius >= limits[1]) &
+                         (center_x + radius <= limits[2]) &
+                         (center_y + radius <= limits[3]) |
+                         ~np.isfinite(radius)) # flat, with no area
+        encroaching = [_get_encroaching(x, y, order, offsets, tile_bounds,
+                                        grid, region,
+                                        (center_x[triangle],
+                                         center_y[triangle],
+                                         radius[triangle]))
+                       for triangle in np.flatnonzero(touches & ~certified)]
+        encroaching = np.setdiff1d(np.concatenate([extra] + encroaching),
+                                   indexes)
+        if len(encroaching) == 0:
+            break
+        extra = np.concatenate((extra, encroaching))
+        indexes = np.concatenate((indexes, encroaching))
+        delaunay.add_points(np.column_stack((x[encroaching],
+                                             y[encroaching])))
+    delaunay.close()
+
+    owned = grid.get_tile(tx.mean(axis=1), ty.mean(axis=1)) == tile
+    simplices = indexes[simplices[owned]]
+    return (simplices, get_projected_areas(x, y, simplices), extra)
+
+def _call_shared(function, descriptors, *args):
+    """
+    Worker process entry point: calls function(x, y, order, offsets, *args)
+    on the arrays shared by the parent process.
+    """
+    memories = []
+    arrays = []
+    for descriptor in descriptors:
+        (memory, array) = attach_array(descriptor)
+        memories.append(memory)
+        arrays.append(array)
+    try:
+        return function(*arrays, *args)
+    finally:
+        del arrays
+        for memory in memories:
+            memory.close()
+
+class TiledTriangularMesh(TriangularMesh):
+    """
+    A TriangularMesh triangulated tile by tile, so that no Delaunay
+    triangulation holds much more than about points_per_tile points. The
+    triangles kept by each tile are certified to be the ones
+    of the Delaunay triangulation of the whole cloud, so volumes, cut/fill
+    and curves match a single TriangularMesh and no triangle is counted by
+    two tiles. Degenerate clouds such as regular grids, where 4 or more
+    points share a circumcircle, have several Delaunay triangulations: the
+    tiles may then split those cells along other diagonals than a single
+    Delaunay does.
+    """
+
+    _grid = None # set once triangulated, None for meshes reopened from disk
+    tile_size = None
+    margin = None
+    workers = 1
+    points_per_tile = 2**20
+
+    def __init__(self,
+                 point_cloud,
+                 tile_size=None,
+                 margin=None,
+                 workers=1,
+                 points_per_tile=2**20):
+        """
+        :param point_cloud: a pandas dataframe containing x, y, z, elevation
+        :param tile_size: (float) side of the square tiles. Default: the size
+                          holding about points_per_tile points.
+        :param margin: (float) margin around each tile whose points are
+                       triangulated with it. The few points beyond it that
+                       a triangle of the tile depends on are added as well.
+                       Default: 5 times the mean point spacing.
+        :param workers: (int) number of worker processes the tiles are split
+                        across. The point arrays are shared with them through
+                        shared memory. Default: 1 (runs in the calling
+                        process).
+        :param points_per_tile: (int) target number of points per tile.
+        """
+        self.tile_size = tile_size
+        self.margin = margin
+        self.workers = workers
+        self.points_per_tile = points_per_tile
+        super().__init__(point_cloud)
+
+    def _triangulate(self):
+        """
+        Builds the tiled Delaunay triangulation on the x, y coordinates of
+        the point_cloud and caches the topology along with each triangle's
+        projected area.
+        """
+        with stage('mesh.triangulate_tiled') as triangulate:
+            self._xy = self.point_cloud[['x', 'y']].to_numpy(dtype=np.float64,
+                                                             copy=True)
+            x = np.ascontiguousarray(self._xy[:, 0])
+            y = np.ascontiguousarray(self._xy[:, 1])
+            bounds = (x.min(), y.min(), x.max(), y.max())
+            area = max((bounds[2] - bounds[0])*(bounds[3] - bounds[1]),
+                       np.finfo(np.float64).tiny)
+            tile_size = self.tile_size
+            if tile_size is None:
+                tile_size = np.sqrt(area*self.points_per_tile/len(x))
+            tile_size = max(tile_size, np.sqrt(area)*1e-6)
+            margin = self.margin
+            if margin is None:
+                margin = 5.0*np.sqrt(area/len(x))
+            self._grid = TileGrid(bounds, tile_size)
+
+            tiles = self._grid.get_tile(x, y)
+            self._order = np.argsort(tiles, kind='stable')
+            self._offsets = np.searchsorted(tiles[self._order],
+                                            np.arange(len(self._grid) + 1))
+            self._margin = margin
+            (simplices, areas, self._hull, self._extra) = \
+                self._triangulate_tiles([x, y, self._order, self._offsets])
+
+            self._delaunay = None
+            self._results = None
+            self._tiles = {}
+            self.data = np.concatenate(simplices).astype(
+                np.int32 if len(x) < 2**31 else np.int64)
+            self._areas = np.concatenate(areas)
+            self.triangular_areas = len(self.data)
+            triangulate.count(points=len(x),
+                              triangles=len(self.data),
+                              tiles=len(self._grid))
+
+    def _add_points(self, data, areas, start):
+        """
+        Triangulates every tile again with the points appended to the
+        point_cloud and returns a tuple of boolean arrays (removed, added)
+        telling which of the previous simplices data were removed and which
+        of the new ones were added.
+        """
+        self._triangulate()
+        return _get_changed_simplices(data, self.data)
+
+    def _triangulate_tiles(self, arrays):
+        """
+        Returns a tuple (simplices, areas, hull, extra) with the triangles
+        kept by every tile, the indexes of the convex hull vertices and the
+        points beyond the margin each tile needed.
+        """
+        grid = self._grid
+        tiles = range(len(grid))
+        shared = []
+        executor = None
+        if self.workers is not None and self.workers > 1 and len(grid) > 1:
+            shared = [share_array(array) for array in arrays]
+            executor = ProcessPoolExecutor(max_workers=self.workers)
+        descriptors = [descriptor for (_, descriptor) in shared]
+
+        def run(function, arguments):
+            if executor is None:
+                return [function(*arrays, *args) for args in arguments]
+            futures = [executor.submit(_call_shared, function, descriptors,
+                                       *args)
+                       for args in arguments]
+            return [future.result() for future in futures]
+
+        try:
+            outlines = run(_get_tile_outline, [(tile,) for tile in tiles])
+            candidates = np.concatenate(
+                [outline for (outline, _) in outlines])
+            hull = np.sort(candidates[ConvexHull(np.column_stack(
+                (arrays[0][candidates], arrays[1][candidates]))).vertices])
+            tile_bounds = np.array([np.full(4, np.nan) if bounds is None
+                                    else bounds
+                                    for (_, bounds) in outlines])
+
+            results = run(_triangulate_tile,
+                          [(tile_bounds, grid, hull, tile, self._margin)
+                           for tile in tiles])
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            for (memory, _) in shared:
+                memory.close()
+                memory.unlink()
+        return ([simplices for (simplices, _, _) in results],
+                [areas for (_, areas, _) in results],
+                hull,
+                [extra for (_, _, extra) in results])
+
+    def _get_tile_delaunay(self, tile):
+        """
+        Returns a tuple (delaunay, indexes) with the triangulation the tile
+        kept its triangles from and the point_cloud indexes of its points.
+        The last row of tiles used is kept, which is the access pattern of
+        rasterize.
+        """
+        if tile not in self._tiles:
+            if len(self._tiles) > self._grid.columns:
+                self._tiles.pop(next(iter(self._tiles)))
+            (x, y) = (self._xy[:, 0], self._xy[:, 1])
+            (_, indexes) = _get_tile_points(x, y, self._order, self._offsets,
+                                            self._grid, self._hull, tile,
+                                            self._margin)
+            indexes = np.concatenate((indexes, self._extra[tile]))
+            delaunay = Delaunay(np.column_stack((x[indexes], y[indexes])))
+            self._tiles[tile] = (delaunay, indexes)
+        return self._tiles[tile]
+
+    def _interpolate(self, points, chunk_size):
+        """
+        Returns a tuple of numpy arrays (inside, elevation) for an Nx2 array
+        of points, located tile by tile in the triangulation of each tile.
+        """
+        if self._grid is None: # reopened from disk: no tiles to reuse
+            return super()._interpolate(points, chunk_size)
+        if self._is_moved():
+            self._triangulate()
+        grid = self._grid
+        z = self.point_cloud['z'].to_numpy(dtype=np.float64)
+
+        inside = np.zeros(len(points), dtype=bool)
+        elevation = np.empty(len(points), dtype=np.float64)
+        with np.errstate(invalid='ignore'):
+            within = ((points[:, 0] >= grid.x_min) &
+                      (points[:, 0] <= grid.x_max) &
+                      (points[:, 1] >= grid.y_min) &
+                      (points[:, 1] <= grid.y_max))
+        queries = np.flatnonzero(within)
+        query_tiles = grid.get_tile(points[queries, 0], points[queries, 1])
+        order = np.argsort(query_tiles, kind='stable')
+        (tiles, starts) = np.unique(query_tiles[order], return_index=True)
+        for (tile, selected) in zip(tiles, np.split(queries[order],
+                                                    starts[1:])):
+            (delaunay, indexes) = self._get_tile_delaunay(tile)
+            selected = selected[_get_spatial_order(points[selected])]
+            for start in range(0, len(selected), chunk_size):
+                chunk = selected[start:start + chunk_size]
+                (inside[chunk], values) = _interpolate(delaunay,
+                                                       z[indexes],
+                                                       points[chunk])
+                elevation[chunk[inside[chunk]]] = values
+        return (inside, elevation)
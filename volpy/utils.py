@@ -1,4 +1,7 @@
 # General use utility functions.
+import logging
+import threading
+import time
 
 def print_progress(iteration,
                    total,
@@ -25,4 +28,120 @@ def print_progress(iteration,
     print('\r%s |%s| %s%% %s' % (prefix, bar, percent, suffix), end = '\r')
     # Print New Line on Complete
     if iteration == total:
-        print() # last print
\ No newline at end of file
+        print() # last print
+
+class Progress():
+    """Throttled, pluggable progress reporting.
+    Updates are cheap: the sink is only called once the count has moved by
+    at least min_percent of the total and min_interval seconds have passed
+    since the last report, plus once on completion. Updates are thread safe.
+    Work split across processes is reported by the parent process as the
+    workers hand their results back.
+    Nothing is reported when there is nothing to do (total <= 0).
+    @params:
+    total       - Required  : total iterations (Int)
+    sink        - Optional  : where reports go. 'bar' (terminal progress bar),
+                              None (silent), a logging.Logger (info records)
+                              or a callable receiving (done, total).
+    prefix      - Optional  : prefix string of bar and log reports (Str)
+    suffix      - Optional  : suffix string of bar and log reports (Str)
+    min_interval- Optional  : minimum seconds between reports (Float)
+    min_percent - Optional  : minimum percent progress between reports (Float)
+    """
+
+    def __init__(self,
+                 total,
+                 sink='bar',
+                 prefix='Progress:',
+                 suffix='Complete',
+                 min_interval=0.1,
+                 min_percent=1.0):
+        self.total = total
+        self.sink = sink
+        self.prefix = prefix
+        self.suffix = suffix
+        self.min_interval = min_interval
+        self.done = 0
+        self._step = max(1, int(total*min_percent/100.0))
+        self._next = None
+        if sink is not None and total > 0:
+            self._next = min(self._step, total)
+        self._last_time = float('-inf')
+        self._lock = threading.Lock()
+
+    def update(self, amount=1):
+        """Adds amount to the iterations done."""
+        with self._lock:
+            self.done += amount
+            if self._next is not None and self.done >= self._next:
+                self._report()
+
+    def set(self, done):
+        """Sets the iterations done."""
+        with self._lock:
+            self.done = done
+            if self._next is not None and self.done >= self._next:
+                self._report()
+
+    def _report(self):
+        now = time.monotonic()
+        finished = self.done >= self.total
+        if not finished and now - self._last_time < self.min_interval:
+            self._next = self.done + self._step
+            return
+        self._last_time = now
+        self._next = None if finished else min(self.done + self._step,
+                                               self.total)
+        if self.sink == 'bar':
+            print_progress(self.done,
+                           self.total,
+                           prefix=self.prefix,
+                           suffix=self.suffix,
+                           length=50)
+        elif isinstance(self.sink, logging.Logger):
+            self.sink.info('%s %d/%d %s',
+                           self.prefix, self.done, self.total, self.suffix)
+        else:
+            self.sink(self.done, self.total)
+
+def get_progress(show_progress, total):
+    """Returns a Progress out of a show_progress argument.
+    @params:
+    show_progress - Required : True (terminal progress bar), False or None
+                               (silent), a logging.Logger, a callable
+                               receiving (done, total) or a Progress, which is
+                               returned as it is.
+    total         - Required : total iterations (Int)
+    """
+    if isinstance(show_progress, Progress):
+        return show_progress
+    if show_progress is True:
+        return Progress(total)
+    if show_progress is False or show_progress is None:
+        return Progress(total, sink=None)
+    return Progress(total, sink=show_progress)
+
+def share_array(array):
+    """Copies a numpy array into a new shared memory block.
+    Returns a tuple (shared_memory, descriptor) where descriptor is a small
+    picklable tuple that worker processes pass to attach_array. The caller
+    owns the block and must close and unlink it once the workers are done.
+    """
+    from multiprocessing import shared_memory
+    import numpy as np
+    shared = shared_memory.SharedMemory(create=True,
+                                        size=max(1, array.nbytes))
+    view = np.ndarray(array.shape, dtype=array.dtype, buffer=shared.buf)
+    view[...] = array
+    return (shared, (shared.name, array.shape, array.dtype.str))
+
+def attach_array(descriptor):
+    """Attaches to a shared memory block created by share_array.
+    Returns a tuple (shared_memory, array). The array is only valid while the
+    shared_memory is open, so close it after the array is no longer used.
+    """
+    from multiprocessing import shared_memory
+    import numpy as np
+    (name, shape, dtype) = descriptor
+    shared = shared_memory.SharedMemory(name=name)
+    return (shared, np.ndarray(shape, dtype=dtype, buffer=shared.buf))